@@ -0,0 +1,163 @@
+"""
+Async facade over DataManager for use from the bot's event loop
+
+Storage calls run on a bounded thread pool so a slow disk never blocks other
+updates or the reminder dispatch. Writes issued close together are coalesced
+into a single transaction (one commit) by a writer task.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DEFAULT_TENANT_ID, SEARCH_RESULT_LIMIT, STORAGE_THREADS, WRITE_COALESCE_DELAY
+from data_manager import DataManager
+
+logger = logging.getLogger(__name__)
+
+class AsyncDataManager:
+    """
+    Awaitable version of the DataManager API
+
+    Reads run directly on the thread pool. Writes are queued; the writer task
+    waits WRITE_COALESCE_DELAY seconds for more writes to arrive and then runs
+    everything queued inside one DataManager.batch() transaction. Each caller
+    still gets the result (or exception) of its own operation.
+    """
+
+    def __init__(self, data_manager: DataManager, max_workers=STORAGE_THREADS, coalesce_delay=WRITE_COALESCE_DELAY):
+        self.data_manager = data_manager
+        self.coalesce_delay = coalesce_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage')
+        self._pending = []
+        self._writer = None
+
+    async def run(self, func, *args, **kwargs):
+        """Run any blocking callable on the storage thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def _read(self, method, *args, **kwargs):
+        """Run a read-only DataManager method on the thread pool"""
+        return await self.run(getattr(self.data_manager, method), *args, **kwargs)
+
+    async def _write(self, method, *args, **kwargs):
+        """Queue a mutating DataManager method and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((getattr(self.data_manager, method), args, kwargs, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+        return await future
+
+    def _run_batch(self, operations):
+        """
+        Run queued writes in one transaction; executed on the thread pool
+        Each write runs in its own savepoint, so one that fails part-way is
+        rolled back on its own instead of committing half its changes.
+        """
+        results = []
+        with self.data_manager.batch():
+            for func, args, kwargs, _ in operations:
+                try:
+                    with self.data_manager.savepoint():
+                        result = func(*args, **kwargs)
+                except Exception as e:
+                    results.append((False, e))
+                else:
+                    results.append((True, result))
+        return results
+
+    async def _write_loop(self):
+        """Drain the write queue, one transaction per burst of writes"""
+        while self._pending:
+            if self.coalesce_delay:
+                await asyncio.sleep(self.coalesce_delay)
+            operations, self._pending = self._pending, []
+            try:
+                results = await self.run(self._run_batch, operations)
+            except Exception as e:
+                # The commit itself failed: every write in the batch is lost
+                logger.error("Write batch of %d operations failed: %s", len(operations), e)
+                results = [(False, e)] * len(operations)
+
+            if len(operations) > 1:
+                logger.debug("Coalesced %d writes into one transaction", len(operations))
+            for (_, _, _, future), (ok, value) in zip(operations, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def close(self):
+        """Shut down the thread pool"""
+        self._executor.shutdown(wait=True)
+
+    # Reads
+    async def get_phone(self, phone_number, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.get_phone"""
+        return await self._read('get_phone', phone_number, tenant_id=tenant_id)
+
+    async def get_all_phones(self, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.get_all_phones"""
+        return await self._read('get_all_phones', tenant_id=tenant_id)
+
+    async def get_phones_page(self, after=None, before=None, limit=20, with_accounts=False, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.get_phones_page"""
+        return await self._read(
+            'get_phones_page', after=after, before=before, limit=limit,
+            with_accounts=with_accounts, tenant_id=tenant_id
+        )
+
+    async def get_renewals_between(self, start_date, end_date, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.get_renewals_between"""
+        return await self._read('get_renewals_between', start_date, end_date, tenant_id=tenant_id)
+
+    async def get_upcoming_renewals(self, days_before=1, days_until=None, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.get_upcoming_renewals"""
+        return await self._read(
+            'get_upcoming_renewals', days_before=days_before, days_until=days_until, tenant_id=tenant_id
+        )
+
+    async def search(self, query, limit=SEARCH_RESULT_LIMIT, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.search"""
+        return await self._read('search', query, limit=limit, tenant_id=tenant_id)
+
+    async def get_due_reminders(self, start_date, end_date):
+        """Awaitable DataManager.get_due_reminders"""
+        return await self._read('get_due_reminders', start_date, end_date)
+
+    async def get_version(self):
+        """Awaitable DataManager.get_version"""
+        return await self._read('get_version')
+
+    # Writes
+    async def add_phone(self, phone_number, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.add_phone"""
+        return await self._write('add_phone', phone_number, renewal_date, tenant_id=tenant_id)
+
+    async def delete_phone(self, phone_number, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.delete_phone"""
+        return await self._write('delete_phone', phone_number, tenant_id=tenant_id)
+
+    async def update_phone_renewal(self, phone_number, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.update_phone_renewal"""
+        return await self._write('update_phone_renewal', phone_number, renewal_date, tenant_id=tenant_id)
+
+    async def add_account(self, phone_number, account_name, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.add_account"""
+        return await self._write('add_account', phone_number, account_name, renewal_date, tenant_id=tenant_id)
+
+    async def delete_account(self, phone_number, account_name, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.delete_account"""
+        return await self._write('delete_account', phone_number, account_name, tenant_id=tenant_id)
+
+    async def update_account_renewal(self, phone_number, account_name, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.update_account_renewal"""
+        return await self._write(
+            'update_account_renewal', phone_number, account_name, renewal_date, tenant_id=tenant_id
+        )
+
+    async def set_reminder_offsets(self, phone_number, account_name, offsets, tenant_id=DEFAULT_TENANT_ID):
+        """Awaitable DataManager.set_reminder_offsets"""
+        return await self._write('set_reminder_offsets', phone_number, account_name, offsets, tenant_id=tenant_id)
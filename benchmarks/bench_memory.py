@@ -0,0 +1,88 @@
+"""
+Memory benchmark for the phone/account record representation
+
+Builds the same synthetic dataset (default: 1M accounts, MAX_ACCOUNTS_PER_NUMBER
+per phone, see common.iter_dataset) twice and reports the memory held by each model:
+  - dicts: the original {'renewal_date': datetime, 'accounts': [{...}]} layout
+  - records: __slots__ records with ordinal dates and interned account names
+Also reports the on-disk size of the same data in the SQLite store.
+
+Usage: python benchmarks/bench_memory.py [--accounts N] [--skip-db]
+"""
+import argparse
+import gc
+import os
+import tempfile
+import tracemalloc
+
+from common import fill, iter_dataset
+from config import DEFAULT_TENANT_ID, MAX_ACCOUNTS_PER_NUMBER
+from records import AccountRecord, PhoneRecord
+
+def dataset(accounts):
+    """The benchmark dataset: MAX_ACCOUNTS_PER_NUMBER accounts per phone"""
+    return iter_dataset(-(-accounts // MAX_ACCOUNTS_PER_NUMBER), MAX_ACCOUNTS_PER_NUMBER)
+
+def build_dicts(accounts):
+    """Original layout: dicts with datetime values"""
+    return {
+        phone: {
+            'renewal_date': renewal_date,
+            'accounts': [{'name': name, 'renewal_date': date} for name, date in items]
+        }
+        for phone, renewal_date, items in dataset(accounts)
+    }
+
+def build_records(accounts):
+    """Compact layout: __slots__ records, ordinal dates, interned names"""
+    return {
+        phone: PhoneRecord(
+            phone,
+            renewal_date.toordinal(),
+            [AccountRecord(name, date.toordinal()) for name, date in items]
+        )
+        for phone, renewal_date, items in dataset(accounts)
+    }
+
+def measure(builder, accounts):
+    """Return (bytes held after building, peak bytes) for one model"""
+    gc.collect()
+    tracemalloc.start()
+    data = builder(accounts)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    gc.collect()
+    return current, peak
+
+def measure_db(accounts):
+    """Return the on-disk size of the dataset in the SQLite store"""
+    from data_manager import DataManager
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        data_manager = DataManager(path, snapshot_path=None)
+        fill(data_manager, dataset(accounts), DEFAULT_TENANT_ID)
+        data_manager.checkpoint()
+        data_manager.close()
+        return os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=1_000_000)
+    parser.add_argument('--skip-db', action='store_true', help='do not measure the SQLite file size')
+    args = parser.parse_args()
+
+    mib = 1024 * 1024
+    args.accounts = -(-args.accounts // MAX_ACCOUNTS_PER_NUMBER) * MAX_ACCOUNTS_PER_NUMBER
+    print(f"Dataset: {args.accounts} accounts, {MAX_ACCOUNTS_PER_NUMBER} per phone")
+    for name, builder in (('dicts', build_dicts), ('records', build_records)):
+        current, peak = measure(builder, args.accounts)
+        print(f"{name:8s} held {current / mib:8.1f} MiB  peak {peak / mib:8.1f} MiB  "
+              f"({current / args.accounts:.0f} B/account)")
+    if not args.skip_db:
+        size = measure_db(args.accounts)
+        print(f"{'sqlite':8s} file {size / mib:8.1f} MiB  ({size / args.accounts:.0f} B/account)")
+
+if __name__ == '__main__':
+    main()
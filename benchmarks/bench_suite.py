@@ -0,0 +1,337 @@
+"""
+Benchmark suite for the storage layer, web API, bot replies and reminder dispatch
+
+Builds a synthetic dataset (phones with up to MAX_ACCOUNTS_PER_NUMBER accounts
+each, renewal dates spread over a year around today) in a temporary database
+and times:
+  storage    get_upcoming_renewals, get_due_reminders, get_all_phones and
+             every DataManager mutation
+  web        /api/phones and /api/upcoming_renewals through the Flask test client
+  bot        list_phones_command reply building (first page and '/danhsachso all')
+  scheduler  check_renewals against an in-process fake Bot that adds a fixed
+             latency per send and answers every Nth send with a 429, in
+             digest and per-item mode
+Results are written as JSON (stdout or --output) so runs on different commits
+can be compared with --compare. Groups whose dependencies are not installed
+are reported as skipped.
+
+Usage: python benchmarks/bench_suite.py [--phones N] [--accounts-per-phone K]
+           [--samples S] [--heavy-samples H] [--groups storage,web,bot,scheduler]
+           [--modes digest,per-item]
+           [--output FILE] [--compare BASELINE.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from common import ROOT, TODAY, fill, iter_dataset, phone_number, summarize, time_async_calls, time_calls
+
+GROUPS = ('storage', 'web', 'bot', 'scheduler')
+SCHEDULER_MODES = ('digest', 'per-item')
+
+def bench_storage(data_manager, args, tenant_id):
+    """Reads and mutations of the DataManager API"""
+    rng = random.Random(1)
+    results = {
+        'get_upcoming_renewals(1)': time_calls(
+            lambda: data_manager.get_upcoming_renewals(days_before=1, tenant_id=tenant_id), args.samples
+        ),
+        'get_upcoming_renewals(0..30)': time_calls(
+            lambda: data_manager.get_upcoming_renewals(days_before=0, days_until=30, tenant_id=tenant_id),
+            args.heavy_samples
+        ),
+        'get_due_reminders(today)': time_calls(
+            lambda: data_manager.get_due_reminders(TODAY, TODAY), args.heavy_samples
+        ),
+        'get_all_phones': time_calls(
+            lambda: data_manager.get_all_phones(tenant_id=tenant_id), args.heavy_samples
+        ),
+        'get_phone': time_calls(
+            lambda: data_manager.get_phone(phone_number(rng.randrange(args.phones)), tenant_id=tenant_id),
+            args.samples
+        ),
+    }
+
+    # Each round adds a fresh phone, walks it through every mutation and
+    # deletes it again, so the dataset has the same size for every sample
+    mutations = {name: [] for name in (
+        'add_phone', 'add_account', 'update_phone_renewal', 'update_account_renewal',
+        'set_reminder_offsets', 'delete_account', 'delete_phone'
+    )}
+    renewal_date = TODAY + timedelta(days=10)
+    for round_number in range(args.samples):
+        number = phone_number(args.phones + round_number)
+        steps = (
+            ('add_phone', lambda: data_manager.add_phone(number, renewal_date, tenant_id=tenant_id)),
+            ('add_account', lambda: data_manager.add_account(number, 'Bench', renewal_date, tenant_id=tenant_id)),
+            ('update_phone_renewal', lambda: data_manager.update_phone_renewal(
+                number, renewal_date + timedelta(days=1), tenant_id=tenant_id
+            )),
+            ('update_account_renewal', lambda: data_manager.update_account_renewal(
+                number, 'Bench', renewal_date + timedelta(days=1), tenant_id=tenant_id
+            )),
+            ('set_reminder_offsets', lambda: data_manager.set_reminder_offsets(
+                number, None, (3, 1), tenant_id=tenant_id
+            )),
+            ('delete_account', lambda: data_manager.delete_account(number, 'Bench', tenant_id=tenant_id)),
+            ('delete_phone', lambda: data_manager.delete_phone(number, tenant_id=tenant_id)),
+        )
+        for name, step in steps:
+            started = time.perf_counter()
+            step()
+            mutations[name].append(time.perf_counter() - started)
+    results.update({name: summarize(timings) for name, timings in mutations.items()})
+    return results
+
+def bench_web(args):
+    """Flask API routes through the test client"""
+    import main
+
+    client = main.app.test_client()
+
+    def get(path):
+        def request():
+            response = client.get(path)
+            # Streamed bodies are only produced while being read
+            response.get_data()
+            assert response.status_code == 200, (path, response.status_code)
+        return request
+
+    return {
+        'GET /api/phones?limit=100': time_calls(get('/api/phones?limit=100'), args.samples),
+        'GET /api/phones (full stream)': time_calls(get('/api/phones'), args.heavy_samples),
+        'GET /api/phones?format=ndjson': time_calls(get('/api/phones?format=ndjson'), args.heavy_samples),
+        'GET /api/upcoming_renewals?days=1': time_calls(get('/api/upcoming_renewals?days=1'), args.samples),
+        'GET /api/upcoming_renewals?days=0&until=30': time_calls(
+            get('/api/upcoming_renewals?days=0&until=30'), args.heavy_samples
+        ),
+    }
+
+def fake_update(chat_id, args):
+    """Minimal Update/Context pair that records the replies of a command handler"""
+    replies = []
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    update = SimpleNamespace(
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=SimpleNamespace(text='/danhsachso ' + ' '.join(args), reply_text=reply_text),
+    )
+    return update, SimpleNamespace(args=list(args)), replies
+
+async def bench_bot(args, tenant_id):
+    """Reply building of the phone list command"""
+    import main
+
+    async def list_phones(command_args):
+        update, context, replies = fake_update(tenant_id, command_args)
+        await main.list_phones_command(update, context)
+        assert replies
+
+    async def send_now(send, bucket, max_retries=None):
+        return await send()
+
+    # '/danhsachso all' paces its replies to Telegram's per-chat limit (about
+    # one message a second); send at once so only reply building is timed
+    send_with_retry, main.send_with_retry = main.send_with_retry, send_now
+    try:
+        results = {
+            'list_phones_command (first page)': await time_async_calls(lambda: list_phones(()), args.samples),
+            'list_phones_command (all)': await time_async_calls(lambda: list_phones(('all',)), args.heavy_samples),
+        }
+    finally:
+        main.send_with_retry = send_with_retry
+        main.async_data_manager.close()
+    return results
+
+class FakeBot:
+    """
+    In-process stand-in for telegram.Bot
+    Every send takes `latency` seconds and every `rate_limit_every`-th send is
+    rejected with RetryAfter, like Telegram's flood control.
+    """
+
+    def __init__(self, latency, rate_limit_every, retry_after):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.calls = 0
+        self.rejected = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        from telegram.error import RetryAfter
+
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.rate_limit_every and self.calls % self.rate_limit_every == 0:
+            self.rejected += 1
+            raise RetryAfter(self.retry_after)
+
+async def bench_scheduler(data_manager, args):
+    """
+    check_renewals end to end: due query, ledger filter, message building and dispatch
+    Digest mode sends a handful of messages; per-item mode sends one per reminder
+    and is the one exercising the dispatcher's rate limiting and RetryAfter handling.
+    Every reminder goes to the one benchmark chat, so the per-chat rate is
+    --per-chat-rate rather than Telegram's (about one message a second).
+    """
+    from scheduler import ReminderScheduler
+
+    results = {}
+    for mode in args.modes:
+        runs = []
+        for _ in range(args.heavy_samples):
+            # Forget earlier deliveries so every run sends the full set again
+            data_manager.prune_reminder_ledger(TODAY + timedelta(days=400))
+            bot = FakeBot(args.latency, args.rate_limit_every, args.retry_after)
+            scheduler = ReminderScheduler(bot, data_manager, digest_mode=mode == 'digest', mode='daily')
+            scheduler.dispatcher.per_chat_rate = args.per_chat_rate
+            started = time.perf_counter()
+            dispatch = await scheduler.check_renewals()
+            elapsed = time.perf_counter() - started
+            runs.append({
+                'elapsed_s': round(elapsed, 3),
+                'send_calls': bot.calls,
+                'rate_limited': bot.rejected,
+                **({'dispatch': dispatch.as_dict()} if dispatch is not None else {}),
+            })
+        results[f'check_renewals ({mode})'] = {
+            'digest_mode': mode == 'digest',
+            'latency_s': args.latency,
+            'rate_limit_every': args.rate_limit_every,
+            'per_chat_rate': args.per_chat_rate,
+            'median_elapsed_s': statistics.median(run['elapsed_s'] for run in runs),
+            'runs': runs,
+        }
+    return results
+
+def git_commit():
+    """Current commit of the repository, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_group(results, name, func):
+    """Run one benchmark group, recording missing dependencies as a skip"""
+    try:
+        results[name] = func()
+    except ImportError as e:
+        results[name] = {'skipped': f"missing dependency: {e}"}
+    print(f"{name}: done", file=sys.stderr)
+
+def compare(baseline, current):
+    """Print the median change of every case present in both result sets"""
+    for group, cases in current['results'].items():
+        old_cases = baseline.get('results', {}).get(group, {})
+        for name, stats in cases.items():
+            old = old_cases.get(name)
+            if not isinstance(stats, dict) or not isinstance(old, dict) or 'median_us' not in stats or 'median_us' not in old:
+                continue
+            change = (stats['median_us'] / old['median_us'] - 1) * 100 if old['median_us'] else 0.0
+            print(
+                f"{group:9s} {name:45s} {old['median_us']:12.1f} -> {stats['median_us']:12.1f} us  ({change:+.1f}%)",
+                file=sys.stderr
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--phones', type=int, default=10_000, help='dataset size (1k to 1M)')
+    parser.add_argument('--accounts-per-phone', type=int, default=None,
+                        help='maximum accounts per phone (default: MAX_ACCOUNTS_PER_NUMBER)')
+    parser.add_argument('--samples', type=int, default=200, help='runs of the cheap cases')
+    parser.add_argument('--heavy-samples', type=int, default=5, help='runs of the full-scan cases')
+    parser.add_argument('--groups', default=','.join(GROUPS), help='comma-separated subset of ' + ','.join(GROUPS))
+    parser.add_argument('--latency', type=float, default=0.05, help='fake Telegram latency per send, seconds')
+    parser.add_argument('--rate-limit-every', type=int, default=50, help='answer every Nth send with a 429 (0: never)')
+    parser.add_argument('--retry-after', type=int, default=1, help='seconds requested by the fake 429')
+    parser.add_argument('--per-chat-rate', type=float, default=None,
+                        help='messages per second to the benchmark chat (default: GLOBAL_MESSAGES_PER_SECOND)')
+    parser.add_argument('--modes', default=','.join(SCHEDULER_MODES),
+                        help='reminder modes to dispatch, comma-separated subset of ' + ','.join(SCHEDULER_MODES))
+    parser.add_argument('--output', help='write the JSON results here instead of stdout')
+    parser.add_argument('--compare', help='baseline JSON file to compare medians against')
+    args = parser.parse_args()
+    groups = [group for group in args.groups.split(',') if group]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+    args.modes = [mode for mode in args.modes.split(',') if mode]
+    unknown = set(args.modes) - set(SCHEDULER_MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # main.py opens DATABASE_PATH on import, so point it at the benchmark
+        # database before anything from the repository is imported
+        os.environ['DATABASE_PATH'] = os.path.join(tmp, 'bench.db')
+        os.environ['SNAPSHOT_PATH'] = os.path.join(tmp, 'bench.snapshot.db')
+        from config import DEFAULT_TENANT_ID, GLOBAL_MESSAGES_PER_SECOND, MAX_ACCOUNTS_PER_NUMBER
+        from data_manager import DataManager
+
+        if args.accounts_per_phone is None:
+            args.accounts_per_phone = MAX_ACCOUNTS_PER_NUMBER
+        if args.per_chat_rate is None:
+            args.per_chat_rate = GLOBAL_MESSAGES_PER_SECOND
+        data_manager = DataManager(os.environ['DATABASE_PATH'], snapshot_path=None)
+        started = time.perf_counter()
+        # Dates from a month ago to eleven months ahead, so every offset and
+        # overdue follow-up has something due today
+        dataset = iter_dataset(
+            args.phones, args.accounts_per_phone, first_date=TODAY - timedelta(days=30), varying=True
+        )
+        fill(data_manager, dataset, DEFAULT_TENANT_ID)
+        fill_time = time.perf_counter() - started
+        print(f"dataset: {args.phones} phones in {fill_time:.1f}s", file=sys.stderr)
+
+        results = {}
+        if 'storage' in groups:
+            run_group(results, 'storage', lambda: bench_storage(data_manager, args, DEFAULT_TENANT_ID))
+        if 'web' in groups:
+            run_group(results, 'web', lambda: bench_web(args))
+        if 'bot' in groups:
+            run_group(results, 'bot', lambda: asyncio.run(bench_bot(args, DEFAULT_TENANT_ID)))
+        if 'scheduler' in groups:
+            run_group(results, 'scheduler', lambda: asyncio.run(bench_scheduler(data_manager, args)))
+        data_manager.close()
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'phones': args.phones,
+            'accounts_per_phone': args.accounts_per_phone,
+            'samples': args.samples,
+            'heavy_samples': args.heavy_samples,
+            'fill_seconds': round(fill_time, 2),
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Multi-tenant benchmark for the DataManager and the reminder fan-out
+
+Fills one database with a growing number of tenants (chats), each holding the
+same number of phones, and reports the median latency of the per-command
+storage calls for a random tenant at every size. With tenant-prefixed keys the
+cost should stay flat as tenants are added. Then runs the cross-tenant due
+reminder query and pushes one digest per tenant through the dispatcher with a
+fake bot (rate limits lifted, so only the fan-out overhead is measured).
+
+Usage: python benchmarks/bench_tenants.py [--tenants N] [--phones P] [--samples S]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+from common import TODAY, fill, iter_dataset, phone_number, time_calls
+from data_manager import DataManager
+
+def fill_tenants(data_manager, first_tenant, last_tenant, phones):
+    """Add `phones` phones with one account each to tenants [first, last)"""
+    with data_manager.batch():
+        for tenant_id in range(first_tenant, last_tenant):
+            fill(data_manager, iter_dataset(phones, 1, days=30), tenant_id)
+
+def median_us(func, samples):
+    """Median wall time of func() in microseconds"""
+    return time_calls(func, samples)['median_us']
+
+def bench_commands(data_manager, tenants, phones, samples):
+    """Median latency of the storage calls behind each bot command"""
+    rng = random.Random(tenants)
+
+    def pick():
+        return rng.randrange(tenants), phone_number(rng.randrange(phones))
+
+    def get_phone():
+        tenant_id, number = pick()
+        data_manager.get_phone(number, tenant_id=tenant_id)
+
+    def first_page():
+        data_manager.get_phones_page(limit=20, tenant_id=rng.randrange(tenants))
+
+    def update_phone():
+        tenant_id, number = pick()
+        data_manager.update_phone_renewal(number, TODAY + timedelta(days=3), tenant_id=tenant_id)
+
+    def add_delete_account():
+        tenant_id, number = pick()
+        data_manager.add_account(number, 'Bench', TODAY, tenant_id=tenant_id)
+        data_manager.delete_account(number, 'Bench', tenant_id=tenant_id)
+
+    return {
+        'get_phone': median_us(get_phone, samples),
+        'page': median_us(first_page, samples),
+        'update': median_us(update_phone, samples),
+        'add+del account': median_us(add_delete_account, samples),
+    }
+
+async def bench_fan_out(data_manager):
+    """Time the cross-tenant due reminder query and a fan-out of one digest per tenant"""
+    from dispatcher import ReminderDispatcher
+    from scheduler import ReminderScheduler
+
+    class FakeBot:
+        async def send_message(self, chat_id, text, parse_mode=None):
+            await asyncio.sleep(0)
+
+    scheduler = ReminderScheduler(FakeBot(), data_manager, digest_mode=True, mode='daily')
+    scheduler.dispatcher = ReminderDispatcher(FakeBot(), global_rate=1e9, per_chat_rate=1e9)
+
+    started = time.perf_counter()
+    reminders = data_manager.get_due_reminders(TODAY, TODAY)
+    query_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    metrics = await scheduler.dispatcher.send_all(scheduler._build_messages(reminders))
+    return len(reminders), query_time, metrics.sent, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tenants', type=int, default=5000)
+    parser.add_argument('--phones', type=int, default=20, help='phones per tenant')
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--skip-dispatch', action='store_true', help='do not run the fan-out part')
+    args = parser.parse_args()
+
+    sizes = sorted({size for size in (10, 100, 1000, args.tenants) if size <= args.tenants})
+    with tempfile.TemporaryDirectory() as tmp:
+        data_manager = DataManager(os.path.join(tmp, 'bench.db'), snapshot_path=None)
+        filled = 0
+        print(f"{'tenants':>8s} " + " ".join(f"{name:>16s}" for name in (
+            'get_phone', 'page', 'update', 'add+del account'
+        )) + "   (median µs)")
+        for size in sizes:
+            fill_tenants(data_manager, filled, size, args.phones)
+            filled = size
+            results = bench_commands(data_manager, size, args.phones, args.samples)
+            print(f"{size:8d} " + " ".join(f"{value:16.1f}" for value in results.values()))
+
+        if not args.skip_dispatch:
+            reminders, query_time, sent, send_time = asyncio.run(bench_fan_out(data_manager))
+            print(f"due query: {reminders} reminders for {filled} tenants in {query_time * 1000:.1f} ms")
+            print(f"fan-out:   {sent} digests sent in {send_time * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
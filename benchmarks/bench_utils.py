@@ -0,0 +1,83 @@
+"""
+Microbenchmark for the date and phone validators in utils
+
+Compares the original implementations (uncompiled regex, validate-then-parse)
+with the current single-pass, precompiled and cached versions.
+
+Usage: python benchmarks/bench_utils.py [--number N]
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+
+# Original implementations, kept here as the baseline
+def legacy_validate_phone_number(phone_number):
+    pattern = r'^(0|\+84)([35789][0-9]{8}|[16][0-9]{8}|[2][0-9]{9})$'
+    return bool(re.match(pattern, phone_number))
+
+def legacy_validate_date_format(date_str):
+    pattern = r'^([0-2][0-9]|3[0-1])/(0[1-9]|1[0-2])/\d{4}$'
+    if not re.match(pattern, date_str):
+        return False
+    try:
+        day, month, year = map(int, date_str.split('/'))
+        datetime.datetime(year, month, day)
+        return True
+    except ValueError:
+        return False
+
+def legacy_parse_date(date_str):
+    if not legacy_validate_date_format(date_str):
+        raise ValueError("Invalid date format, use DD/MM/YYYY")
+    day, month, year = map(int, date_str.split('/'))
+    return datetime.datetime(year, month, day)
+
+def legacy_command_path(date_str):
+    # Command handlers validated once more before parsing
+    legacy_validate_date_format(date_str)
+    return legacy_parse_date(date_str)
+
+def uncached_parse_date(date_str):
+    return utils.parse_date.__wrapped__(date_str)
+
+def uncached_validate_phone_number(phone_number):
+    return utils.validate_phone_number.__wrapped__(phone_number)
+
+def run(number):
+    """Time each implementation and return per-call costs in nanoseconds"""
+    dates = [f"{day:02d}/{month:02d}/2026" for month in range(1, 13) for day in range(1, 29)]
+    phones = [f"09{i:08d}" for i in range(len(dates))]
+
+    cases = {
+        'parse_date (legacy, handler path)': lambda: [legacy_command_path(d) for d in dates],
+        'parse_date (single pass, uncached)': lambda: [uncached_parse_date(d) for d in dates],
+        'parse_date (single pass, cached)': lambda: [utils.parse_date(d) for d in dates],
+        'validate_phone_number (legacy)': lambda: [legacy_validate_phone_number(p) for p in phones],
+        'validate_phone_number (compiled, uncached)': lambda: [uncached_validate_phone_number(p) for p in phones],
+        'validate_phone_number (compiled, cached)': lambda: [utils.validate_phone_number(p) for p in phones],
+    }
+
+    results = {}
+    for name, func in cases.items():
+        func()  # warm up caches
+        elapsed = min(timeit.repeat(func, number=number, repeat=5))
+        results[name] = elapsed / (number * len(dates)) * 1e9
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=200, help='loops per timing run')
+    args = parser.parse_args()
+
+    for name, ns_per_call in run(args.number).items():
+        print(f"{name:45s} {ns_per_call:8.0f} ns/call")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Shared helpers for the benchmark scripts: the synthetic dataset and timing
+
+Nothing from the repository is imported here, so scripts can still adjust the
+environment (DATABASE_PATH, ...) after importing this module and before
+importing config or main.
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ACCOUNT_NAMES = ['Facebook', 'Zalo', 'Gmail', 'TikTok', 'Shopee', 'Momo']
+TODAY = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+def phone_number(i):
+    """Synthetic phone number for index i"""
+    return f"09{i:08d}"
+
+def account_name(i, j):
+    """Name of the j-th account of phone i; distinct for every j of a phone"""
+    name = ACCOUNT_NAMES[(i + j) % len(ACCOUNT_NAMES)]
+    # Built at runtime, as names arrive from the database or a request
+    return ''.join((name, str(j // len(ACCOUNT_NAMES)))) if j >= len(ACCOUNT_NAMES) else ''.join(name)
+
+def iter_dataset(phones, accounts_per_phone, first_date=TODAY, days=365, varying=False):
+    """
+    Yield (phone_number, renewal_date, [(account_name, renewal_date), ...]) for
+    `phones` phones, with renewal dates spread over `days` days from first_date
+    Every phone gets accounts_per_phone accounts, or i % (accounts_per_phone + 1)
+    when `varying` is set, so the dataset mixes phones with and without accounts.
+    """
+    for i in range(phones):
+        count = i % (accounts_per_phone + 1) if varying else accounts_per_phone
+        yield (
+            phone_number(i),
+            first_date + timedelta(days=i % days),
+            [
+                (account_name(i, j), first_date + timedelta(days=(i + 7 * j) % days))
+                for j in range(count)
+            ]
+        )
+
+def fill(data_manager, dataset, tenant_id):
+    """Store a dataset from iter_dataset for one tenant, in one transaction"""
+    with data_manager.batch():
+        for number, renewal_date, accounts in dataset:
+            data_manager.add_phone(number, renewal_date, tenant_id=tenant_id)
+            for name, date in accounts:
+                data_manager.add_account(number, name, date, tenant_id=tenant_id)
+
+def summarize(timings):
+    """Summary statistics of a list of durations, in microseconds"""
+    timings = sorted(timings)
+    return {
+        'samples': len(timings),
+        'median_us': round(statistics.median(timings) * 1e6, 1),
+        'p95_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1e6, 1),
+        'mean_us': round(statistics.fmean(timings) * 1e6, 1),
+    }
+
+def time_calls(func, samples):
+    """Call func() `samples` times and summarize the durations"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+async def time_async_calls(func, samples):
+    """Await func() `samples` times and summarize the durations"""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
@@ -1,15 +1,126 @@
 """
 Configuration settings for the Telegram bot
 """
+import hashlib
+import hmac
 import os
 
 # Bot configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7457507869:AAGIUIVl8hok9smOnGbF1XboElfjo4AEoho")
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID", "7519889601")
 
+# Multi-tenant settings: every chat (tenant) has its own dataset, keyed by chat id
+# Comma-separated chat ids allowed to use the bot, or "*" to allow any chat
+TENANT_CHAT_IDS = os.getenv("TENANT_CHAT_IDS", ADMIN_CHAT_ID)
+ALLOW_ALL_TENANTS = TENANT_CHAT_IDS.strip() == "*"
+ALLOWED_TENANT_IDS = frozenset(
+    int(chat_id) for chat_id in TENANT_CHAT_IDS.split(",") if chat_id.strip() not in ("", "*")
+)
+# Tenant owning data created before multi-tenancy and data sent to the web API
+# without an explicit tenant
+DEFAULT_TENANT_ID = int(ADMIN_CHAT_ID)
+# Web API access to other tenants: comma-separated "<chat id>:<token>" pairs.
+# ?tenant=<chat id> is only honoured with a matching X-API-Token header; without
+# the parameter the API serves DEFAULT_TENANT_ID as before
+TENANT_API_TOKENS = dict(
+    (int(chat_id), token.strip())
+    for chat_id, _, token in (
+        pair.strip().partition(":") for pair in os.getenv("TENANT_API_TOKENS", "").split(",")
+    )
+    if chat_id and token.strip()
+)
+
+# How 'python main.py' receives updates: "polling" or "webhook"
+BOT_RUN_MODE = os.getenv("BOT_RUN_MODE", "polling")
+# Number of updates processed at the same time (1 = sequential)
+# Handlers that modify a phone number take a per-number lock (see locks.py)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "32"))
+
+# Webhook settings (webhook run mode and the unified server in server.py)
+# Public base URL Telegram should POST updates to, e.g. https://bot.example.com
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+# Telegram echoes this in the X-Telegram-Bot-Api-Secret-Token header of every
+# update and requests without it are rejected. When not set it is derived from
+# BOT_TOKEN, so it is stable across workers and restarts but never empty.
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "") or hmac.new(
+    BOT_TOKEN.encode(), b"telegram-webhook", hashlib.sha256
+).hexdigest()
+# Local address the webhook run mode listens on
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+
+# Storage settings
+DATABASE_PATH = os.getenv("DATABASE_PATH", "data.db")
+# Commits append to the write-ahead log; after this many pages SQLite folds
+# the log back into the database file
+WAL_AUTOCHECKPOINT_PAGES = int(os.getenv("WAL_AUTOCHECKPOINT_PAGES", "1000"))
+# Size the log file is truncated to after a checkpoint
+WAL_SIZE_LIMIT_BYTES = int(os.getenv("WAL_SIZE_LIMIT_BYTES", str(64 * 1024 * 1024)))
+# Explicit checkpoint interval, run by the scheduler
+CHECKPOINT_INTERVAL_MINUTES = int(os.getenv("CHECKPOINT_INTERVAL_MINUTES", "15"))
+# Compacted copy of the database, refreshed daily; used if the database file is lost
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "data.snapshot.db")
+SNAPSHOT_HOUR = int(os.getenv("SNAPSHOT_HOUR", "3"))
+# Threads running storage I/O for the bot's async handlers
+STORAGE_THREADS = int(os.getenv("STORAGE_THREADS", "4"))
+# Seconds the writer waits to group concurrent writes into one transaction
+WRITE_COALESCE_DELAY = float(os.getenv("WRITE_COALESCE_DELAY", "0.005"))
+
 # Application settings
 MAX_ACCOUNTS_PER_NUMBER = 3
 REMINDER_DAYS_BEFORE = 1
+# Days before a renewal on which reminders are sent, e.g. "7,3,1"
+# (phones and accounts can override this with /nhacnho)
+REMINDER_OFFSETS = tuple(sorted(
+    {int(days) for days in os.getenv("REMINDER_OFFSETS", str(REMINDER_DAYS_BEFORE)).split(",") if days.strip()},
+    reverse=True
+))
+# Days after a missed renewal on which escalating follow-ups are sent
+OVERDUE_FOLLOWUP_DAYS = tuple(sorted(
+    {int(days) for days in os.getenv("OVERDUE_FOLLOWUP_DAYS", "1,3,7").split(",") if days.strip()}
+))
+# Largest offset accepted in a per-item reminder schedule
+MAX_REMINDER_OFFSET_DAYS = 60
+# Hour of the day at which reminders are sent
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "8"))
+# "daily": scan for tomorrow's renewals once a day at REMINDER_HOUR
+# "event": keep a timer per upcoming reminder, updated as data changes
+REMINDER_MODE = os.getenv("REMINDER_MODE", "daily").lower()
+# In event mode, how many days ahead reminders are kept in memory
+REMINDER_HORIZON_DAYS = int(os.getenv("REMINDER_HORIZON_DAYS", "7"))
+
+# Reminder delivery settings (Telegram allows ~30 messages/s per bot and ~1 message/s per chat)
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "16"))
+GLOBAL_MESSAGES_PER_SECOND = float(os.getenv("GLOBAL_MESSAGES_PER_SECOND", "30"))
+PER_CHAT_MESSAGES_PER_SECOND = float(os.getenv("PER_CHAT_MESSAGES_PER_SECOND", "1"))
+MAX_SEND_RETRIES = int(os.getenv("MAX_SEND_RETRIES", "3"))
+
+# How long delivered reminders are remembered (prevents duplicates after restarts)
+LEDGER_RETENTION_DAYS = int(os.getenv("LEDGER_RETENTION_DAYS", "60"))
+
+# Group the day's reminders into a few long messages instead of one message per item
+REMINDER_DIGEST_MODE = os.getenv("REMINDER_DIGEST_MODE", "true").lower() in ("1", "true", "yes")
+# Telegram rejects messages longer than 4096 characters
+MAX_MESSAGE_LENGTH = 4096
+# Number of phones shown per page of /danhsachso
+PHONES_PAGE_SIZE = int(os.getenv("PHONES_PAGE_SIZE", "20"))
+# Number of phones fetched per storage call when streaming the whole list
+STREAM_PAGE_SIZE = 500
+# Largest page the /api/phones endpoint will return
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "1000"))
+# Search results shown by /timkiem, and the most /api/search returns (?limit=)
+SEARCH_RESULT_LIMIT = int(os.getenv("SEARCH_RESULT_LIMIT", "20"))
+SEARCH_MAX_RESULTS = 200
+# Similarity (0..1) an account name needs to count as a fuzzy match
+SEARCH_FUZZY_CUTOFF = float(os.getenv("SEARCH_FUZZY_CUTOFF", "0.6"))
+# Rendered pages and list replies kept per cache (evicted least recently used)
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "256"))
+
+# Bulk import settings
+IMPORT_FILE_EXTENSIONS = ('.csv', '.xlsx', '.xlsm')
+# Number of per-row errors listed in the bot's import report
+IMPORT_ERRORS_SHOWN = 20
 
 # Command help text
 HELP_TEXT = """
@@ -22,7 +133,8 @@ Các lệnh cơ bản:
 Quản lý số điện thoại:
 /themso <số điện thoại> <ngày gia hạn> - Thêm số điện thoại mới
    Ví dụ: /themso 0912345678 25/12/2025
-/danhsachso - Liệt kê tất cả số điện thoại
+/danhsachso - Liệt kê số điện thoại (theo trang)
+/danhsachso all - Gửi toàn bộ danh sách số điện thoại
 /xoaso <số điện thoại> - Xóa số điện thoại
    Ví dụ: /xoaso 0912345678
 /suaso <số điện thoại> <ngày gia hạn mới> - Chỉnh sửa ngày gia hạn
@@ -38,8 +150,27 @@ Quản lý tài khoản:
 /suatk <số điện thoại> <tên tài khoản> <ngày gia hạn mới> - Chỉnh sửa ngày gia hạn tài khoản
    Ví dụ: /suatk 0912345678 Facebook 25/01/2026
 
+Lịch nhắc nhở:
+/nhacnho <số điện thoại> [tên tài khoản] <số ngày,...> - Đặt các ngày nhắc trước hạn
+   Ví dụ: /nhacnho 0912345678 7,3,1
+   Ví dụ: /nhacnho 0912345678 Facebook 14,7
+/nhacnho <số điện thoại> [tên tài khoản] macdinh - Dùng lại lịch nhắc mặc định
+
+Tìm kiếm:
+/timkiem <từ khóa> - Tìm theo một phần số điện thoại hoặc tên tài khoản
+   Ví dụ: /timkiem 0912 (đầu số), /timkiem 5678 (đuôi số), /timkiem face
+
+Xuất dữ liệu:
+/xuat [csv|ndjson] - Xuất toàn bộ danh sách ra file (mặc định CSV)
+
+Nhập hàng loạt:
+Gửi file CSV hoặc Excel (.xlsx) vào cuộc trò chuyện với các cột:
+   phone_number, renewal_date, account_name, account_renewal_date
+   (hai cột tài khoản có thể để trống)
+
 Lưu ý:
 - Mỗi số điện thoại có thể có tối đa 3 tài khoản
-- Bot sẽ gửi thông báo trước 1 ngày khi đến ngày gia hạn
+- Bot sẽ gửi thông báo trước 1 ngày khi đến ngày gia hạn (có thể đổi bằng /nhacnho)
+- Nếu quá ngày gia hạn mà chưa cập nhật, bot sẽ tiếp tục nhắc sau 1, 3 và 7 ngày
 - Định dạng ngày: DD/MM/YYYY (ngày/tháng/năm)
 """
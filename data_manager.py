@@ -0,0 +1,1208 @@
+"""
+Data manager module - persistent storage for phone numbers and accounts
+Backed by an embedded SQLite database in WAL mode so every lookup and
+mutation goes through an index and the data survives restarts
+"""
+import difflib
+import heapq
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from config import (
+    DATABASE_PATH,
+    DEFAULT_TENANT_ID,
+    MAX_ACCOUNTS_PER_NUMBER,
+    MAX_REMINDER_OFFSET_DAYS,
+    OVERDUE_FOLLOWUP_DAYS,
+    REMINDER_OFFSETS,
+    SEARCH_FUZZY_CUTOFF,
+    SEARCH_RESULT_LIMIT,
+    SNAPSHOT_PATH,
+    WAL_AUTOCHECKPOINT_PAGES,
+    WAL_SIZE_LIMIT_BYTES,
+)
+from metrics import timed_storage
+from records import AccountRecord, PhoneRecord, from_ordinal, to_ordinal
+from utils import (
+    COUNTRY_CODE,
+    NATIONAL_NUMBER_LENGTHS,
+    canonical_phone_key,
+    due_reminder_offsets,
+    format_phone_key,
+    national_number,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+-- Every table is partitioned by tenant (the Telegram chat owning the data):
+-- primary keys lead with tenant_id, so a tenant's lookups and page scans only
+-- touch its own slice of each B-tree, however many tenants share the file.
+-- Numbers are keyed by phone_key, the E.164 form as an integer (84912345678),
+-- so every spelling of a number maps to one record and lookups compare integers.
+CREATE TABLE IF NOT EXISTS phones (
+    tenant_id INTEGER NOT NULL,
+    phone_key INTEGER NOT NULL,
+    renewal_date INTEGER NOT NULL,
+    -- The national number reversed, so "ends with" searches are range scans
+    -- ("starts with" searches are key ranges on the primary key)
+    reversed_number TEXT NOT NULL,
+    PRIMARY KEY (tenant_id, phone_key)
+);
+CREATE INDEX IF NOT EXISTS idx_phones_tenant_renewal_date ON phones (tenant_id, renewal_date);
+CREATE INDEX IF NOT EXISTS idx_phones_tenant_reversed ON phones (tenant_id, reversed_number);
+-- Cross-tenant index for the reminder scheduler, which scans all tenants at once
+CREATE INDEX IF NOT EXISTS idx_phones_renewal_date ON phones (renewal_date);
+
+CREATE TABLE IF NOT EXISTS accounts (
+    tenant_id INTEGER NOT NULL,
+    phone_key INTEGER NOT NULL,
+    account_name TEXT NOT NULL,
+    renewal_date INTEGER NOT NULL,
+    -- Case-folded account name, the search key
+    name_key TEXT NOT NULL,
+    PRIMARY KEY (tenant_id, phone_key, account_name),
+    FOREIGN KEY (tenant_id, phone_key) REFERENCES phones (tenant_id, phone_key) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_tenant_renewal_date ON accounts (tenant_id, renewal_date);
+CREATE INDEX IF NOT EXISTS idx_accounts_renewal_date ON accounts (renewal_date);
+CREATE INDEX IF NOT EXISTS idx_accounts_tenant_name_key ON accounts (tenant_id, name_key, phone_key);
+
+-- Inverted index vocabulary: the distinct account names of each tenant with
+-- their number of accounts, kept up to date by triggers. Fuzzy name search
+-- scans this (small) table; the postings are idx_accounts_tenant_name_key.
+CREATE TABLE IF NOT EXISTS account_names (
+    tenant_id INTEGER NOT NULL,
+    name_key TEXT NOT NULL,
+    account_count INTEGER NOT NULL,
+    PRIMARY KEY (tenant_id, name_key)
+) WITHOUT ROWID;
+
+-- Dataset version, bumped by triggers on every change so readers (HTTP ETags,
+-- caches, other processes) can tell cheaply whether anything changed
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+-- Reminders already delivered, keyed by item ("<tenant>:phone:<number>" or
+-- "<tenant>:account:<number>:<name>", numbers in display form), renewal date
+-- and offset, so restarts and manual checks never send the same reminder twice
+CREATE TABLE IF NOT EXISTS reminder_ledger (
+    item_key TEXT NOT NULL,
+    renewal_date INTEGER NOT NULL,
+    reminder_offset INTEGER NOT NULL,
+    sent_at TEXT NOT NULL,
+    PRIMARY KEY (item_key, renewal_date, reminder_offset)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_reminder_ledger_renewal_date ON reminder_ledger (renewal_date);
+
+-- Per-item reminder offsets ("7,3,1"), only for items that override the
+-- global REMINDER_OFFSETS; account_name is '' for the phone itself
+CREATE TABLE IF NOT EXISTS reminder_schedules (
+    tenant_id INTEGER NOT NULL,
+    phone_key INTEGER NOT NULL,
+    account_name TEXT NOT NULL DEFAULT '',
+    offsets TEXT NOT NULL,
+    PRIMARY KEY (tenant_id, phone_key, account_name),
+    FOREIGN KEY (tenant_id, phone_key) REFERENCES phones (tenant_id, phone_key) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS phones_insert_version AFTER INSERT ON phones
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS phones_update_version AFTER UPDATE ON phones
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS phones_delete_version AFTER DELETE ON phones
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS accounts_insert_version AFTER INSERT ON accounts
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS accounts_update_version AFTER UPDATE ON accounts
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS accounts_delete_version AFTER DELETE ON accounts
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS reminder_schedules_insert_version AFTER INSERT ON reminder_schedules
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS reminder_schedules_update_version AFTER UPDATE ON reminder_schedules
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS reminder_schedules_delete_version AFTER DELETE ON reminder_schedules
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+CREATE TRIGGER IF NOT EXISTS accounts_insert_name AFTER INSERT ON accounts
+BEGIN
+    INSERT INTO account_names (tenant_id, name_key, account_count) VALUES (NEW.tenant_id, NEW.name_key, 1)
+    ON CONFLICT (tenant_id, name_key) DO UPDATE SET account_count = account_count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS accounts_delete_name AFTER DELETE ON accounts
+BEGIN
+    UPDATE account_names SET account_count = account_count - 1
+    WHERE tenant_id = OLD.tenant_id AND name_key = OLD.name_key;
+    DELETE FROM account_names
+    WHERE tenant_id = OLD.tenant_id AND name_key = OLD.name_key AND account_count <= 0;
+END;
+"""
+
+# Bump SCHEMA_VERSION and add a step to MIGRATIONS when the schema changes;
+# each step runs inside the same transaction as the SCHEMA script. The "post"
+# parts run against the latest SCHEMA, and can read the id of the tenant that
+# owns pre-existing data from meta ('default_tenant') and use the SQL
+# functions registered in _create_schema to fill derived columns.
+SCHEMA_VERSION = 4
+
+_DROP_TRIGGERS_AND_INDEXES = """
+        DROP TRIGGER IF EXISTS phones_insert_version;
+        DROP TRIGGER IF EXISTS phones_update_version;
+        DROP TRIGGER IF EXISTS phones_delete_version;
+        DROP TRIGGER IF EXISTS accounts_insert_version;
+        DROP TRIGGER IF EXISTS accounts_update_version;
+        DROP TRIGGER IF EXISTS accounts_delete_version;
+        DROP TRIGGER IF EXISTS reminder_schedules_insert_version;
+        DROP TRIGGER IF EXISTS reminder_schedules_update_version;
+        DROP TRIGGER IF EXISTS reminder_schedules_delete_version;
+        DROP TRIGGER IF EXISTS accounts_insert_name;
+        DROP TRIGGER IF EXISTS accounts_delete_name;
+        DROP INDEX IF EXISTS idx_phones_renewal_date;
+        DROP INDEX IF EXISTS idx_accounts_renewal_date;
+        DROP INDEX IF EXISTS idx_phones_tenant_renewal_date;
+        DROP INDEX IF EXISTS idx_accounts_tenant_renewal_date;
+        DROP INDEX IF EXISTS idx_phones_tenant_national;
+        DROP INDEX IF EXISTS idx_phones_tenant_reversed;
+        DROP INDEX IF EXISTS idx_accounts_tenant_name_key;
+"""
+
+_DEFAULT_TENANT = "(SELECT value FROM meta WHERE key = 'default_tenant')"
+
+def _copy_into_current(suffix, tenant=_DEFAULT_TENANT, date="renewal_date", schedules=True):
+    """
+    SQL moving the phones, accounts and reminder schedules of an older schema
+    (tables renamed to <table>_<suffix>) into the current tables, in one pass.
+    Numbers are rekeyed by canonical_phone_key; spellings of the same number
+    are merged, keeping the latest renewal date and every reminder offset.
+    """
+    sql = f"""
+        INSERT INTO phones (tenant_id, phone_key, renewal_date, reversed_number)
+        SELECT {tenant}, canonical_phone_key(phone_number), MAX({date}),
+               reverse_text(national_number(phone_number))
+        FROM phones_{suffix} GROUP BY 1, 2;
+        INSERT INTO accounts (tenant_id, phone_key, account_name, renewal_date, name_key)
+        SELECT {tenant}, canonical_phone_key(phone_number), account_name, MAX({date}), name_key(account_name)
+        FROM accounts_{suffix} GROUP BY 1, 2, 3 ORDER BY MIN(rowid);
+    """
+    if schedules:
+        sql += f"""
+        INSERT INTO reminder_schedules (tenant_id, phone_key, account_name, offsets)
+        SELECT {tenant}, canonical_phone_key(phone_number), account_name, merge_offsets(group_concat(offsets))
+        FROM reminder_schedules_{suffix} GROUP BY 1, 2, 3;
+        DROP TABLE reminder_schedules_{suffix};
+        """
+    return sql + f"""
+        DROP TABLE accounts_{suffix};
+        DROP TABLE phones_{suffix};
+    """
+
+MIGRATIONS = {
+    # Version 1: renewal dates stored as ordinals (INTEGER) instead of ISO text
+    1: (
+        _DROP_TRIGGERS_AND_INDEXES + """
+        ALTER TABLE phones RENAME TO phones_v0;
+        ALTER TABLE accounts RENAME TO accounts_v0;
+        """,
+        _copy_into_current(
+            'v0', date="CAST(julianday(renewal_date) - 1721424.5 AS INTEGER)", schedules=False
+        )
+    ),
+    # Version 2: tables partitioned by tenant; existing data goes to the default tenant.
+    # The version 1 tables are created empty first when migrating straight from
+    # version 0, whose step has already moved the original tables aside.
+    2: (
+        _DROP_TRIGGERS_AND_INDEXES + """
+        CREATE TABLE IF NOT EXISTS phones (
+            phone_number TEXT PRIMARY KEY, renewal_date INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS accounts (
+            phone_number TEXT NOT NULL REFERENCES phones (phone_number) ON DELETE CASCADE,
+            account_name TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            PRIMARY KEY (phone_number, account_name)
+        );
+        CREATE TABLE IF NOT EXISTS reminder_schedules (
+            phone_number TEXT NOT NULL REFERENCES phones (phone_number) ON DELETE CASCADE,
+            account_name TEXT NOT NULL DEFAULT '', offsets TEXT NOT NULL,
+            PRIMARY KEY (phone_number, account_name)
+        ) WITHOUT ROWID;
+        ALTER TABLE phones RENAME TO phones_v1;
+        ALTER TABLE accounts RENAME TO accounts_v1;
+        ALTER TABLE reminder_schedules RENAME TO reminder_schedules_v1;
+        """,
+        _copy_into_current('v1') + f"""
+        UPDATE reminder_ledger SET item_key = {_DEFAULT_TENANT} || ':' || item_key;
+        """
+    ),
+    # Version 3: search keys for numbers and account names, plus the account
+    # name vocabulary (filled by the accounts_insert_name trigger while copying)
+    3: (
+        _DROP_TRIGGERS_AND_INDEXES + """
+        CREATE TABLE IF NOT EXISTS phones (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number)
+        );
+        CREATE TABLE IF NOT EXISTS accounts (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name),
+            FOREIGN KEY (tenant_id, phone_number) REFERENCES phones (tenant_id, phone_number) ON DELETE CASCADE
+        );
+        CREATE TABLE IF NOT EXISTS reminder_schedules (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL DEFAULT '', offsets TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name),
+            FOREIGN KEY (tenant_id, phone_number) REFERENCES phones (tenant_id, phone_number) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        ALTER TABLE phones RENAME TO phones_v2;
+        ALTER TABLE accounts RENAME TO accounts_v2;
+        ALTER TABLE reminder_schedules RENAME TO reminder_schedules_v2;
+        """,
+        _copy_into_current('v2', tenant="tenant_id")
+    ),
+    # Version 4: numbers keyed by their canonical integer E.164 form. Spellings
+    # of the same number are merged, the vocabulary is recounted from the merged
+    # accounts and delivered-reminder keys are rewritten to the display form.
+    4: (
+        _DROP_TRIGGERS_AND_INDEXES + """
+        CREATE TABLE IF NOT EXISTS phones (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            national_number TEXT NOT NULL, reversed_number TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number)
+        );
+        CREATE TABLE IF NOT EXISTS accounts (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL, renewal_date INTEGER NOT NULL, name_key TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name),
+            FOREIGN KEY (tenant_id, phone_number) REFERENCES phones (tenant_id, phone_number) ON DELETE CASCADE
+        );
+        CREATE TABLE IF NOT EXISTS reminder_schedules (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL DEFAULT '', offsets TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name),
+            FOREIGN KEY (tenant_id, phone_number) REFERENCES phones (tenant_id, phone_number) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        ALTER TABLE phones RENAME TO phones_v3;
+        ALTER TABLE accounts RENAME TO accounts_v3;
+        ALTER TABLE reminder_schedules RENAME TO reminder_schedules_v3;
+        """,
+        _copy_into_current('v3', tenant="tenant_id") + """
+        DELETE FROM account_names;
+        INSERT INTO account_names (tenant_id, name_key, account_count)
+        SELECT tenant_id, name_key, COUNT(*) FROM accounts GROUP BY tenant_id, name_key;
+        UPDATE OR REPLACE reminder_ledger SET item_key = canonical_item_key(item_key);
+        """
+    ),
+}
+
+# Queries made of digits (spaces, dots and dashes ignored) search phone numbers
+_NUMBER_QUERY = re.compile(r'\+?[0-9]+')
+_SEARCH_SEPARATORS = re.compile(r'[\s.\-]')
+
+# Dates are stored as proleptic ordinals: compact integers that compare and
+# index faster than text
+_to_db_date = to_ordinal
+_from_db_date = from_ordinal
+
+def _name_key(account_name):
+    """Search key of an account name: case-insensitive, also for Vietnamese letters"""
+    return account_name.casefold()
+
+def _prefix_bounds(prefix):
+    """(low, high) such that low <= key < high holds exactly for keys starting with prefix"""
+    return prefix, prefix + '\U0010ffff'
+
+def _phone_key(phone_number):
+    """
+    Storage key of a phone number given in any accepted spelling, or already as a key
+    Raises ValueError for numbers validate_phone_number rejects
+    """
+    if isinstance(phone_number, int):
+        return phone_number
+    phone_key = canonical_phone_key(phone_number)
+    if phone_key is None:
+        raise ValueError(f"Invalid phone number: {phone_number!r}")
+    return phone_key
+
+def _reversed_number(phone_key):
+    """Suffix search key of a phone: its national number reversed"""
+    return format_phone_key(phone_key)[1:][::-1]
+
+def _key_prefix_ranges(prefix):
+    """
+    Inclusive (low, high) phone key ranges holding exactly the numbers whose
+    national number starts with `prefix`, one per number length, in key order
+    """
+    ranges = []
+    for length in NATIONAL_NUMBER_LENGTHS:
+        rest = length - len(prefix)
+        if rest >= 0:
+            low = int(f"{COUNTRY_CODE}{prefix}") * 10 ** rest
+            ranges.append((low, low + 10 ** rest - 1))
+    return ranges
+
+def _canonical_item_key(item_key):
+    """Rewrite the number in a reminder ledger key to its display form"""
+    parts = item_key.split(':', 3)
+    phone_key = canonical_phone_key(parts[2]) if len(parts) > 2 else None
+    if phone_key is None:
+        return item_key
+    parts[2] = format_phone_key(phone_key)
+    return ':'.join(parts)
+
+def _encode_offsets(offsets):
+    """Store reminder offsets as comma-separated text"""
+    return ",".join(str(offset) for offset in offsets)
+
+def _merge_offsets(text):
+    """Union of comma-separated offset lists, encoded as by _encode_offsets"""
+    return _encode_offsets(sorted({int(offset) for offset in text.split(",")}, reverse=True))
+
+def _decode_offsets(text):
+    """Read reminder offsets stored by _encode_offsets; None means the global default"""
+    if text is None:
+        return None
+    return tuple(int(offset) for offset in text.split(","))
+
+class DataManager:
+    """
+    Stores phone numbers and their linked accounts
+
+    Phones are keyed by number, accounts by (phone number, account name) and
+    both tables carry an index on renewal_date, so lookups, mutations and the
+    renewal query are all O(log n) without loading the dataset into memory.
+
+    Numbers are stored as canonical integer keys (see canonical_phone_key):
+    methods accept any valid spelling ('0912345678', '+84912345678') or a key,
+    raise ValueError for invalid numbers, and return numbers in display form.
+
+    Data is partitioned by tenant (the chat that owns it): every method takes
+    a tenant_id, defaulting to DEFAULT_TENANT_ID, and only sees that tenant's
+    phones and accounts.
+    """
+
+    def __init__(self, db_path=DATABASE_PATH, snapshot_path=SNAPSHOT_PATH):
+        """
+        Open (or create) the database and make sure the schema exists
+        If the database file is missing but a snapshot exists, start from the snapshot
+        """
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self._local = threading.local()
+        self._listeners = []
+        if snapshot_path and not os.path.exists(db_path) and os.path.exists(snapshot_path):
+            logger.warning("Database %s not found, restoring from snapshot %s", db_path, snapshot_path)
+            shutil.copyfile(snapshot_path, db_path)
+        self._create_schema()
+        logger.info("Data manager ready using database %s", db_path)
+
+    def _create_schema(self):
+        """Create the tables, or migrate an existing database to SCHEMA_VERSION"""
+        conn = self._connect()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            conn.executescript(SCHEMA)
+            return
+
+        has_tables = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'phones'"
+        ).fetchone() is not None
+        before, after = [], []
+        if has_tables:
+            for step in range(version + 1, SCHEMA_VERSION + 1):
+                pre, post = MIGRATIONS[step]
+                before.append(pre)
+                after.append(post)
+            logger.info("Migrating database %s from schema %d to %d", self.db_path, version, SCHEMA_VERSION)
+            if version < 4:
+                invalid = [
+                    row[0] for row in conn.execute("SELECT phone_number FROM phones")
+                    if canonical_phone_key(row[0]) is None
+                ]
+                if invalid:
+                    raise ValueError(
+                        f"Cannot migrate {self.db_path}: {len(invalid)} invalid phone numbers "
+                        f"(e.g. {', '.join(map(repr, invalid[:5]))}); fix or delete them first"
+                    )
+
+        # Helpers for migrations that fill derived columns from existing rows
+        conn.create_function('national_number', 1, national_number, deterministic=True)
+        conn.create_function('reverse_text', 1, lambda text: text[::-1], deterministic=True)
+        conn.create_function('name_key', 1, _name_key, deterministic=True)
+        conn.create_function('canonical_phone_key', 1, canonical_phone_key, deterministic=True)
+        conn.create_function('canonical_item_key', 1, _canonical_item_key, deterministic=True)
+        conn.create_function('merge_offsets', 1, _merge_offsets, deterministic=True)
+
+        # One script, one transaction: either the whole migration applies or none of it
+        conn.executescript(
+            "BEGIN IMMEDIATE;"
+            + "".join(before)
+            + SCHEMA
+            + f"INSERT OR REPLACE INTO meta (key, value) VALUES ('default_tenant', {int(DEFAULT_TENANT_ID)});"
+            + "".join(after)
+            + f"PRAGMA user_version = {SCHEMA_VERSION};"
+            + "COMMIT;"
+        )
+
+    def _connect(self):
+        """Return the SQLite connection owned by the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA wal_autocheckpoint={WAL_AUTOCHECKPOINT_PAGES}")
+            conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT_BYTES}")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run the enclosed statements as a single write transaction"""
+        conn = self._connect()
+        if conn.in_transaction:
+            # Nested inside batch(): the outermost block commits
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.changes = []
+        # Read under the write lock, so listeners learn exactly which versions
+        # this commit moved the dataset between
+        self._local.start_version = self._read_version(conn) if self._listeners else None
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            self._local.changes = []
+            raise
+        else:
+            versions = (self._local.start_version, self._read_version(conn)) if self._local.changes else None
+            conn.execute("COMMIT")
+            changes, self._local.changes = self._local.changes, []
+            self._publish_changes(changes, versions)
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Run the enclosed statements so that an exception undoes only them
+        Inside batch(), a block that raises leaves no writes (or change
+        notifications) behind while the rest of the transaction still commits.
+        """
+        with self._transaction() as conn:
+            changes = len(self._local.changes)
+            conn.execute("SAVEPOINT op")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK TO op")
+                conn.execute("RELEASE op")
+                del self._local.changes[changes:]
+                raise
+            conn.execute("RELEASE op")
+
+    def batch(self):
+        """
+        Group several mutations into a single transaction
+        Every add/update/delete called inside the block shares one commit:
+
+            with data_manager.batch():
+                data_manager.add_phone(...)
+                data_manager.add_account(...)
+        """
+        return self._transaction()
+
+    # Change notifications
+    def add_listener(self, callback):
+        """
+        Register callback(tenant_id, phone_number, account_name, renewal_date,
+        reminder_offsets, versions) for committed changes. account_name is None for the phone itself;
+        renewal_date is None when the item was deleted (deleting a phone also
+        deletes all of its accounts); reminder_offsets is None for items using
+        the global REMINDER_OFFSETS. versions is the (before, after) dataset
+        version of the commit (see get_version), or None if unknown.
+        Callbacks run on the thread that committed, after the commit.
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Unregister a callback added with add_listener"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _record_change(self, conn, tenant_id, phone_key, account_name, renewal_date):
+        """Remember a change made in the current transaction until it commits"""
+        if not self._listeners:
+            return
+        offsets = None
+        if renewal_date is not None:
+            row = conn.execute(
+                "SELECT offsets FROM reminder_schedules "
+                "WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+                (tenant_id, phone_key, account_name or '')
+            ).fetchone()
+            offsets = _decode_offsets(row['offsets']) if row else None
+        self._local.changes.append((tenant_id, format_phone_key(phone_key), account_name, renewal_date, offsets))
+
+    def _publish_changes(self, changes, versions):
+        """Hand committed changes to the registered listeners"""
+        for change in changes:
+            for callback in list(self._listeners):
+                try:
+                    callback(*change, versions)
+                except Exception as e:
+                    logger.error("Change listener failed for %s: %s", change, e)
+
+    # Persistence maintenance
+    # Every commit only appends the changed pages to the write-ahead log
+    # (<db>-wal), so write cost follows the size of the change. SQLite replays
+    # the log on open after a crash; checkpoints fold it back into the main file.
+    @timed_storage
+    def checkpoint(self):
+        """
+        Fold the write-ahead log into the database file and truncate it
+        Returns (busy, log_pages, checkpointed_pages) as reported by SQLite
+        """
+        result = tuple(self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone())
+        logger.info("WAL checkpoint: busy=%s, log=%s, checkpointed=%s", *result)
+        return result
+
+    @timed_storage
+    def snapshot(self, path=None):
+        """
+        Write a consistent, compacted copy of the database to `path`
+        The copy is written to a temporary file, fsynced and atomically renamed,
+        so a crash mid-snapshot never leaves a half-written snapshot behind
+        """
+        path = path or self.snapshot_path
+        if not path:
+            raise ValueError("No snapshot path configured")
+
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            self._connect().backup(target)
+            target.execute("PRAGMA journal_mode=DELETE")
+            target.execute("VACUUM")
+        finally:
+            target.close()
+
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        logger.info("Database snapshot written to %s", path)
+        return path
+
+    def close(self):
+        """Close the connection of the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @timed_storage
+    def get_version(self):
+        """Return the dataset version, which changes whenever any data changes"""
+        return self._read_version(self._connect())
+
+    @staticmethod
+    def _read_version(conn):
+        """Dataset version as seen by conn"""
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _load_accounts(self, conn, tenant_id, phone_key):
+        """Load the accounts of a phone in insertion order"""
+        rows = conn.execute(
+            "SELECT account_name, renewal_date FROM accounts "
+            "WHERE tenant_id = ? AND phone_key = ? ORDER BY rowid",
+            (tenant_id, phone_key)
+        ).fetchall()
+        return [AccountRecord(row['account_name'], row['renewal_date']) for row in rows]
+
+    # Phone operations
+    @timed_storage
+    def add_phone(self, phone_number, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Add a new phone number
+        Returns True if added, False if the number already exists
+        """
+        phone_key = _phone_key(phone_number)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO phones (tenant_id, phone_key, renewal_date, reversed_number) "
+                "VALUES (?, ?, ?, ?)",
+                (tenant_id, phone_key, _to_db_date(renewal_date), _reversed_number(phone_key))
+            )
+            if cursor.rowcount == 1:
+                self._record_change(conn, tenant_id, phone_key, None, renewal_date)
+        return cursor.rowcount == 1
+
+    @timed_storage
+    def get_phone(self, phone_number, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Get a phone number with its accounts
+        Returns a PhoneRecord (read like a dict with 'renewal_date' and
+        'accounts'), or None if not found
+        """
+        phone_key = _phone_key(phone_number)
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT renewal_date FROM phones WHERE tenant_id = ? AND phone_key = ?",
+            (tenant_id, phone_key)
+        ).fetchone()
+        if row is None:
+            return None
+        return PhoneRecord(
+            format_phone_key(phone_key), row['renewal_date'], self._load_accounts(conn, tenant_id, phone_key)
+        )
+
+    @timed_storage
+    def get_all_phones(self, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Get all phone numbers with their accounts, ordered by number
+        Returns a dict of phone number -> PhoneRecord
+        """
+        conn = self._connect()
+        by_key = {}
+        for row in conn.execute(
+            "SELECT phone_key, renewal_date FROM phones WHERE tenant_id = ? ORDER BY phone_key",
+            (tenant_id,)
+        ):
+            by_key[row['phone_key']] = PhoneRecord(format_phone_key(row['phone_key']), row['renewal_date'])
+        for row in conn.execute(
+            "SELECT phone_key, account_name, renewal_date FROM accounts WHERE tenant_id = ? ORDER BY rowid",
+            (tenant_id,)
+        ):
+            by_key[row['phone_key']].add_account(AccountRecord(row['account_name'], row['renewal_date']))
+        return {phone.phone_number: phone for phone in by_key.values()}
+
+    @timed_storage
+    def get_phones_page(self, after=None, before=None, limit=20, with_accounts=False, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Get one page of phones ordered by number using keyset pagination
+        Pass `after` (last number of the previous page) to move forward or
+        `before` (first number of the current page) to move back.
+        Returns (phones, has_prev, has_next) where phones is a list of dicts with
+        'phone_number', 'renewal_date' and 'account_count' (plus 'accounts'
+        when with_accounts is set)
+        """
+        conn = self._connect()
+        query = (
+            "SELECT p.phone_key, p.renewal_date, "
+            "(SELECT COUNT(*) FROM accounts a "
+            "WHERE a.tenant_id = p.tenant_id AND a.phone_key = p.phone_key) AS account_count "
+            "FROM phones p WHERE p.tenant_id = ? "
+        )
+        if before is not None:
+            rows = conn.execute(
+                query + "AND p.phone_key < ? ORDER BY p.phone_key DESC LIMIT ?",
+                (tenant_id, _phone_key(before), limit + 1)
+            ).fetchall()
+            has_prev = len(rows) > limit
+            rows = rows[:limit][::-1]
+            has_next = True
+        else:
+            if after is not None:
+                rows = conn.execute(
+                    query + "AND p.phone_key > ? ORDER BY p.phone_key LIMIT ?",
+                    (tenant_id, _phone_key(after), limit + 1)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    query + "ORDER BY p.phone_key LIMIT ?", (tenant_id, limit + 1)
+                ).fetchall()
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            has_prev = after is not None and bool(rows) and conn.execute(
+                "SELECT 1 FROM phones WHERE tenant_id = ? AND phone_key < ? LIMIT 1",
+                (tenant_id, rows[0]['phone_key'])
+            ).fetchone() is not None
+
+        phones = [
+            {
+                'phone_number': format_phone_key(row['phone_key']),
+                'renewal_date': _from_db_date(row['renewal_date']),
+                'account_count': row['account_count']
+            }
+            for row in rows
+        ]
+        if with_accounts and phones:
+            self._attach_accounts(conn, tenant_id, phones, [row['phone_key'] for row in rows])
+        return phones, has_prev, has_next
+
+    def _attach_accounts(self, conn, tenant_id, phones, phone_keys):
+        """
+        Load the accounts of a sorted list of phones with one range query
+        over the (tenant_id, phone_key, account_name) primary key
+        """
+        by_key = dict(zip(phone_keys, phones))
+        for phone in phones:
+            phone['accounts'] = []
+        for row in conn.execute(
+            "SELECT phone_key, account_name, renewal_date FROM accounts "
+            "WHERE tenant_id = ? AND phone_key BETWEEN ? AND ? ORDER BY rowid",
+            (tenant_id, phone_keys[0], phone_keys[-1])
+        ):
+            phone = by_key.get(row['phone_key'])
+            if phone is not None:
+                phone['accounts'].append(AccountRecord(row['account_name'], row['renewal_date']))
+
+    def iter_phones(self, batch_size=500, with_accounts=False, after=None, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Iterate over all phones in number order, one page at a time
+        Only a single page is held in memory, whatever the size of the dataset
+        """
+        while True:
+            phones, _, has_next = self.get_phones_page(
+                after=after, limit=batch_size, with_accounts=with_accounts, tenant_id=tenant_id
+            )
+            yield from phones
+            if not has_next:
+                return
+            after = phones[-1]['phone_number']
+
+    @timed_storage
+    def delete_phone(self, phone_number, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Delete a phone number and all of its accounts
+        Returns True if deleted, False if not found
+        """
+        phone_key = _phone_key(phone_number)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM phones WHERE tenant_id = ? AND phone_key = ?", (tenant_id, phone_key)
+            )
+            if cursor.rowcount == 1:
+                self._record_change(conn, tenant_id, phone_key, None, None)
+        return cursor.rowcount == 1
+
+    @timed_storage
+    def update_phone_renewal(self, phone_number, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Update the renewal date of a phone number
+        Returns True if updated, False if not found
+        """
+        phone_key = _phone_key(phone_number)
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE phones SET renewal_date = ? WHERE tenant_id = ? AND phone_key = ?",
+                (_to_db_date(renewal_date), tenant_id, phone_key)
+            )
+            if cursor.rowcount == 1:
+                self._record_change(conn, tenant_id, phone_key, None, renewal_date)
+        return cursor.rowcount == 1
+
+    # Account operations
+    @timed_storage
+    def add_account(self, phone_number, account_name, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Add an account to a phone number
+        Returns a (success, message) tuple
+        """
+        phone_key = _phone_key(phone_number)
+        phone_number = format_phone_key(phone_key)
+        with self._transaction() as conn:
+            if conn.execute(
+                "SELECT 1 FROM phones WHERE tenant_id = ? AND phone_key = ?", (tenant_id, phone_key)
+            ).fetchone() is None:
+                return False, f"Số điện thoại {phone_number} không tồn tại."
+
+            if conn.execute(
+                "SELECT 1 FROM accounts WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+                (tenant_id, phone_key, account_name)
+            ).fetchone() is not None:
+                return False, f"Tài khoản {account_name} đã tồn tại cho số {phone_number}."
+
+            account_count = conn.execute(
+                "SELECT COUNT(*) FROM accounts WHERE tenant_id = ? AND phone_key = ?",
+                (tenant_id, phone_key)
+            ).fetchone()[0]
+            if account_count >= MAX_ACCOUNTS_PER_NUMBER:
+                return False, (
+                    f"Số điện thoại {phone_number} đã có tối đa "
+                    f"{MAX_ACCOUNTS_PER_NUMBER} tài khoản."
+                )
+
+            conn.execute(
+                "INSERT INTO accounts (tenant_id, phone_key, account_name, renewal_date, name_key) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (tenant_id, phone_key, account_name, _to_db_date(renewal_date), _name_key(account_name))
+            )
+            self._record_change(conn, tenant_id, phone_key, account_name, renewal_date)
+        return True, f"Đã thêm tài khoản {account_name} cho số {phone_number}."
+
+    @timed_storage
+    def delete_account(self, phone_number, account_name, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Delete an account from a phone number
+        Returns a (success, message) tuple
+        """
+        phone_key = _phone_key(phone_number)
+        phone_number = format_phone_key(phone_key)
+        with self._transaction() as conn:
+            if conn.execute(
+                "SELECT 1 FROM phones WHERE tenant_id = ? AND phone_key = ?", (tenant_id, phone_key)
+            ).fetchone() is None:
+                return False, f"Số điện thoại {phone_number} không tồn tại."
+
+            cursor = conn.execute(
+                "DELETE FROM accounts WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+                (tenant_id, phone_key, account_name)
+            )
+            if cursor.rowcount:
+                conn.execute(
+                    "DELETE FROM reminder_schedules "
+                    "WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+                    (tenant_id, phone_key, account_name)
+                )
+                self._record_change(conn, tenant_id, phone_key, account_name, None)
+        if cursor.rowcount == 0:
+            return False, f"Không tìm thấy tài khoản {account_name} của số {phone_number}."
+        return True, f"Đã xóa tài khoản {account_name} của số {phone_number}."
+
+    @timed_storage
+    def update_account_renewal(self, phone_number, account_name, renewal_date, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Update the renewal date of an account
+        Returns a (success, message) tuple
+        """
+        phone_key = _phone_key(phone_number)
+        phone_number = format_phone_key(phone_key)
+        with self._transaction() as conn:
+            if conn.execute(
+                "SELECT 1 FROM phones WHERE tenant_id = ? AND phone_key = ?", (tenant_id, phone_key)
+            ).fetchone() is None:
+                return False, f"Số điện thoại {phone_number} không tồn tại."
+
+            cursor = conn.execute(
+                "UPDATE accounts SET renewal_date = ? "
+                "WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+                (_to_db_date(renewal_date), tenant_id, phone_key, account_name)
+            )
+            if cursor.rowcount:
+                self._record_change(conn, tenant_id, phone_key, account_name, renewal_date)
+        if cursor.rowcount == 0:
+            return False, f"Không tìm thấy tài khoản {account_name} của số {phone_number}."
+        return True, (
+            f"Đã cập nhật ngày gia hạn tài khoản {account_name} của số {phone_number} "
+            f"thành {renewal_date.strftime('%d/%m/%Y')}."
+        )
+
+    @timed_storage
+    def set_reminder_offsets(self, phone_number, account_name, offsets, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Set the days before renewal on which a phone (account_name None) or an
+        account is reminded; empty offsets restore the global REMINDER_OFFSETS
+        Returns a (success, message) tuple
+        """
+        phone_key = _phone_key(phone_number)
+        phone_number = format_phone_key(phone_key)
+        with self._transaction() as conn:
+            if account_name is None:
+                row = conn.execute(
+                    "SELECT renewal_date FROM phones WHERE tenant_id = ? AND phone_key = ?",
+                    (tenant_id, phone_key)
+                ).fetchone()
+                if row is None:
+                    return False, f"Số điện thoại {phone_number} không tồn tại."
+                target = f"số {phone_number}"
+            else:
+                row = conn.execute(
+                    "SELECT renewal_date FROM accounts "
+                    "WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+                    (tenant_id, phone_key, account_name)
+                ).fetchone()
+                if row is None:
+                    return False, f"Không tìm thấy tài khoản {account_name} của số {phone_number}."
+                target = f"tài khoản {account_name} của số {phone_number}"
+
+            if offsets:
+                conn.execute(
+                    "INSERT OR REPLACE INTO reminder_schedules "
+                    "(tenant_id, phone_key, account_name, offsets) VALUES (?, ?, ?, ?)",
+                    (tenant_id, phone_key, account_name or '', _encode_offsets(offsets))
+                )
+            else:
+                conn.execute(
+                    "DELETE FROM reminder_schedules "
+                    "WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+                    (tenant_id, phone_key, account_name or '')
+                )
+            self._record_change(conn, tenant_id, phone_key, account_name, _from_db_date(row['renewal_date']))
+
+        if not offsets:
+            return True, f"Đã đặt lại lịch nhắc mặc định cho {target}."
+        days = ", ".join(str(offset) for offset in offsets)
+        return True, f"Đã đặt lịch nhắc cho {target}: trước {days} ngày."
+
+    @timed_storage
+    def get_reminder_offsets(self, phone_number, account_name=None, tenant_id=DEFAULT_TENANT_ID):
+        """Get the custom reminder offsets of a phone or account, or None if it uses the default"""
+        row = self._connect().execute(
+            "SELECT offsets FROM reminder_schedules "
+            "WHERE tenant_id = ? AND phone_key = ? AND account_name = ?",
+            (tenant_id, _phone_key(phone_number), account_name or '')
+        ).fetchone()
+        return _decode_offsets(row['offsets']) if row else None
+
+    # Reminder queries
+    @timed_storage
+    def get_renewals_between(self, start_date, end_date, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Get phones and accounts renewing between start_date and end_date (inclusive)
+        Each table is range-scanned through its (tenant_id, renewal_date) index
+        and the two already-sorted streams are merged, so the cost is O(log n + k)
+        """
+        conn = self._connect()
+        bounds = (tenant_id, _to_db_date(start_date), _to_db_date(end_date))
+
+        phone_rows = conn.execute(
+            "SELECT phone_key, renewal_date FROM phones "
+            "WHERE tenant_id = ? AND renewal_date BETWEEN ? AND ? ORDER BY renewal_date",
+            bounds
+        )
+        account_rows = conn.execute(
+            "SELECT phone_key, account_name, renewal_date FROM accounts "
+            "WHERE tenant_id = ? AND renewal_date BETWEEN ? AND ? ORDER BY renewal_date",
+            bounds
+        )
+        phones = (
+            {
+                'type': 'phone',
+                'phone_number': format_phone_key(row['phone_key']),
+                'renewal_date': _from_db_date(row['renewal_date'])
+            }
+            for row in phone_rows
+        )
+        accounts = (
+            {
+                'type': 'account',
+                'phone_number': format_phone_key(row['phone_key']),
+                'account_name': sys.intern(row['account_name']),
+                'renewal_date': _from_db_date(row['renewal_date'])
+            }
+            for row in account_rows
+        )
+        return list(heapq.merge(phones, accounts, key=lambda renewal: renewal['renewal_date']))
+
+    @timed_storage
+    def search(self, query, limit=SEARCH_RESULT_LIMIT, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Find phones by part of their number and accounts by (part of) their name
+        A query of digits matches numbers starting with it (0 and +84 prefixes
+        are equivalent); without such a prefix it also matches numbers ending
+        with it. Any other query matches account names that start with it, then
+        names containing it, then names similar to it (see SEARCH_FUZZY_CUTOFF).
+        Every step is an index range scan, apart from the fuzzy pass over the
+        tenant's distinct account names.
+        Returns up to `limit` renewal dicts (as get_renewals_between) with an
+        extra 'match' key: 'prefix', 'suffix', 'name' or 'fuzzy'
+        """
+        query = query.strip()
+        if not query or limit <= 0:
+            return []
+        conn = self._connect()
+        digits = _SEARCH_SEPARATORS.sub('', query)
+        if _NUMBER_QUERY.fullmatch(digits):
+            return self._search_numbers(conn, tenant_id, digits, limit)
+        return self._search_accounts(conn, tenant_id, _name_key(query), limit)
+
+    def _search_numbers(self, conn, tenant_id, digits, limit):
+        """Phones whose national number starts (or, for bare digits, ends) with the query"""
+        national = national_number(digits)
+        if national.startswith('+'):
+            # Another country code: no stored number can match
+            return []
+        # Numbers starting with the query form one key range per number length
+        searches = [
+            ('prefix', "phone_key BETWEEN ? AND ? ORDER BY phone_key", bounds)
+            for bounds in _key_prefix_ranges(national)
+        ]
+        if national == digits:
+            # No 0/+84 prefix: the digits may just as well be the end of a number
+            searches.append((
+                'suffix', "reversed_number >= ? AND reversed_number < ? ORDER BY reversed_number",
+                _prefix_bounds(national[::-1])
+            ))
+        results = {}
+        for match, condition, bounds in searches:
+            rows = conn.execute(
+                f"SELECT phone_key, renewal_date FROM phones WHERE tenant_id = ? AND {condition} LIMIT ?",
+                (tenant_id, *bounds, limit)
+            )
+            for row in rows:
+                results.setdefault(row['phone_key'], {
+                    'type': 'phone',
+                    'phone_number': format_phone_key(row['phone_key']),
+                    'renewal_date': _from_db_date(row['renewal_date']),
+                    'match': match
+                })
+        return list(results.values())[:limit]
+
+    def _search_accounts(self, conn, tenant_id, key, limit):
+        """Accounts whose name starts with, contains or resembles the query"""
+        low, high = _prefix_bounds(key)
+        names = [(row[0], 'name') for row in conn.execute(
+            "SELECT name_key FROM account_names WHERE tenant_id = ? AND name_key >= ? AND name_key < ? "
+            "ORDER BY name_key LIMIT ?",
+            (tenant_id, low, high, limit)
+        )]
+        if len(names) < limit:
+            vocabulary = [row[0] for row in conn.execute(
+                "SELECT name_key FROM account_names WHERE tenant_id = ?", (tenant_id,)
+            )]
+            seen = {name for name, _ in names}
+            names += [(name, 'name') for name in vocabulary if key in name and name not in seen]
+            seen.update(name for name, _ in names)
+            names += [
+                (name, 'fuzzy')
+                for name in difflib.get_close_matches(key, vocabulary, n=limit, cutoff=SEARCH_FUZZY_CUTOFF)
+                if name not in seen
+            ]
+
+        results = []
+        for name, match in names:
+            rows = conn.execute(
+                "SELECT phone_key, account_name, renewal_date FROM accounts "
+                "WHERE tenant_id = ? AND name_key = ? ORDER BY phone_key LIMIT ?",
+                (tenant_id, name, limit - len(results))
+            )
+            results.extend(
+                {
+                    'type': 'account',
+                    'phone_number': format_phone_key(row['phone_key']),
+                    'account_name': sys.intern(row['account_name']),
+                    'renewal_date': _from_db_date(row['renewal_date']),
+                    'match': match
+                }
+                for row in rows
+            )
+            if len(results) >= limit:
+                break
+        return results
+
+    @timed_storage
+    def get_upcoming_renewals(self, days_before=1, days_until=None, tenant_id=DEFAULT_TENANT_ID):
+        """
+        Get phones and accounts renewing `days_before` days from today
+        If days_until is given, return the whole window [days_before, days_until]
+        """
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if days_until is None:
+            days_until = days_before
+        return self.get_renewals_between(
+            today + timedelta(days=days_before),
+            today + timedelta(days=days_until),
+            tenant_id=tenant_id
+        )
+
+    @timed_storage
+    def get_due_reminders(self, start_date, end_date, offsets=REMINDER_OFFSETS, followups=OVERDUE_FOLLOWUP_DAYS):
+        """
+        Get every reminder due between start_date and end_date (inclusive), for all tenants
+        One query covers all offsets: it range-scans renewal dates through the
+        cross-tenant indexes over the window the global offsets and follow-ups
+        can reach, plus the (few) items with a custom schedule reaching further
+        out. Offsets are then resolved per row in memory. Each result is a
+        renewal dict with 'tenant_id', 'offset' (days before the renewal,
+        negative for overdue follow-ups) and 'due_date' added; an item appears
+        once per reminder due.
+        """
+        start = _to_db_date(start_date)
+        end = _to_db_date(end_date)
+        low = start - max(followups, default=0)
+        high = end + max(offsets, default=0)
+        custom_high = end + MAX_REMINDER_OFFSET_DAYS
+
+        rows = self._connect().execute(
+            "SELECT p.tenant_id, p.phone_key, NULL AS account_name, p.renewal_date, s.offsets "
+            "FROM phones p LEFT JOIN reminder_schedules s "
+            "ON s.tenant_id = p.tenant_id AND s.phone_key = p.phone_key AND s.account_name = '' "
+            "WHERE p.renewal_date BETWEEN :low AND :high "
+            "UNION ALL "
+            "SELECT p.tenant_id, p.phone_key, NULL, p.renewal_date, s.offsets "
+            "FROM reminder_schedules s JOIN phones p "
+            "ON p.tenant_id = s.tenant_id AND p.phone_key = s.phone_key "
+            "WHERE s.account_name = '' AND p.renewal_date > :high AND p.renewal_date <= :custom_high "
+            "UNION ALL "
+            "SELECT a.tenant_id, a.phone_key, a.account_name, a.renewal_date, s.offsets "
+            "FROM accounts a LEFT JOIN reminder_schedules s "
+            "ON s.tenant_id = a.tenant_id AND s.phone_key = a.phone_key "
+            "AND s.account_name = a.account_name "
+            "WHERE a.renewal_date BETWEEN :low AND :high "
+            "UNION ALL "
+            "SELECT a.tenant_id, a.phone_key, a.account_name, a.renewal_date, s.offsets "
+            "FROM reminder_schedules s JOIN accounts a "
+            "ON a.tenant_id = s.tenant_id AND a.phone_key = s.phone_key "
+            "AND a.account_name = s.account_name "
+            "WHERE s.account_name != '' AND a.renewal_date > :high AND a.renewal_date <= :custom_high",
+            {'low': low, 'high': high, 'custom_high': custom_high}
+        )
+
+        reminders = []
+        for row in rows:
+            item_offsets = _decode_offsets(row['offsets']) or offsets
+            for offset, due in due_reminder_offsets(row['renewal_date'], item_offsets, followups, start, end):
+                reminder = {
+                    'tenant_id': row['tenant_id'],
+                    'type': 'phone' if row['account_name'] is None else 'account',
+                    'phone_number': format_phone_key(row['phone_key']),
+                    'renewal_date': _from_db_date(row['renewal_date']),
+                    'offset': offset,
+                    'due_date': _from_db_date(due),
+                }
+                if row['account_name'] is not None:
+                    reminder['account_name'] = row['account_name']
+                reminders.append(reminder)
+        reminders.sort(key=lambda reminder: (reminder['due_date'], reminder['renewal_date']))
+        return reminders
+
+    # Delivery ledger
+    @timed_storage
+    def get_delivered_reminders(self, start_date, end_date):
+        """
+        Get the ledger entries for renewals between start_date and end_date
+        Returns a set of (item_key, renewal_ordinal, reminder_offset) tuples,
+        so callers can check each candidate reminder in O(1)
+        """
+        rows = self._connect().execute(
+            "SELECT item_key, renewal_date, reminder_offset FROM reminder_ledger "
+            "WHERE renewal_date BETWEEN ? AND ?",
+            (_to_db_date(start_date), _to_db_date(end_date))
+        )
+        return {tuple(row) for row in rows}
+
+    @timed_storage
+    def record_delivered_reminders(self, entries):
+        """
+        Record delivered reminders
+        `entries` is an iterable of (item_key, renewal_ordinal, reminder_offset)
+        """
+        sent_at = datetime.now().isoformat(timespec='seconds')
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO reminder_ledger "
+                "(item_key, renewal_date, reminder_offset, sent_at) VALUES (?, ?, ?, ?)",
+                ((item_key, renewal_ordinal, offset, sent_at) for item_key, renewal_ordinal, offset in entries)
+            )
+
+    @timed_storage
+    def prune_reminder_ledger(self, before_date):
+        """Delete ledger entries for renewals before `before_date`"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM reminder_ledger WHERE renewal_date < ?", (_to_db_date(before_date),)
+            )
+        return cursor.rowcount
@@ -0,0 +1,240 @@
+"""
+Dispatcher module for sending reminder messages through the Telegram API
+Sends with bounded concurrency while staying under Telegram's rate limits
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from config import (
+    SEND_CONCURRENCY,
+    GLOBAL_MESSAGES_PER_SECOND,
+    PER_CHAT_MESSAGES_PER_SECOND,
+    MAX_SEND_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class OutgoingMessage:
+    """A single message waiting to be delivered"""
+    chat_id: str
+    text: str
+    parse_mode: str = 'Markdown'
+    label: str = ''
+    # Opaque data handed back to the on_delivered callback
+    payload: object = None
+
+@dataclass
+class DispatchMetrics:
+    """Counters collected while dispatching a batch of messages"""
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    rate_limited: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)
+
+    def as_dict(self):
+        """Return the metrics as a JSON-serializable dict"""
+        return {
+            'queued': self.queued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'rate_limited': self.rate_limited,
+            'elapsed': round(self.elapsed, 3),
+            'messages_per_second': round(self.sent / self.elapsed, 2) if self.elapsed else 0.0,
+            'errors': self.errors,
+        }
+
+class TokenBucket:
+    """
+    Token bucket rate limiter for asyncio code
+    Refills `rate` tokens per second up to `capacity`; waiters are served in order
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        """Add the tokens earned since the last update"""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                await asyncio.sleep(wait)
+
+def _retry_after_seconds(error):
+    """Read the delay from a RetryAfter error (int or timedelta depending on version)"""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+async def send_with_retry(send, bucket, max_retries=MAX_SEND_RETRIES):
+    """
+    Await send() once `bucket` hands out a token, pausing the bucket and trying
+    again when Telegram answers with flood control (RetryAfter)
+    For handlers replying with a long series of messages to a single chat.
+    """
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            return await send()
+        except RetryAfter as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_after_seconds(e)
+            logger.warning("Flood control hit while replying, pausing for %ss", delay)
+            bucket.pause(delay)
+
+class ReminderDispatcher:
+    """
+    Delivers batches of messages through a pool of worker tasks
+
+    Every send takes a token from the chat's bucket and from the global bucket,
+    so throughput is bounded by Telegram's limits rather than by round-trip
+    latency. A RetryAfter response pauses the global bucket for the requested
+    time and the message is retried.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        concurrency=SEND_CONCURRENCY,
+        global_rate=GLOBAL_MESSAGES_PER_SECOND,
+        per_chat_rate=PER_CHAT_MESSAGES_PER_SECOND,
+        max_retries=MAX_SEND_RETRIES,
+    ):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self._global_bucket = None
+        self._chat_buckets = {}
+
+    def _chat_bucket(self, chat_id):
+        """Return the rate limiter for a chat, creating it on first use"""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def _deliver(self, message, metrics, on_delivered=None):
+        """Send one message, retrying on flood control and network errors"""
+        for attempt in range(self.max_retries + 1):
+            await self._chat_bucket(message.chat_id).acquire()
+            await self._global_bucket.acquire()
+            try:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    parse_mode=message.parse_mode
+                )
+                metrics.sent += 1
+                logger.info("Sent reminder %s", message.label)
+                if on_delivered is not None:
+                    await on_delivered(message)
+                return True
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                metrics.rate_limited += 1
+                logger.warning("Flood control hit, pausing sends for %ss", delay)
+                self._global_bucket.pause(delay)
+                self._chat_bucket(message.chat_id).pause(delay)
+                error = e
+            except BadRequest as e:
+                # Unparsable entities, chat not found, ... are permanent; caught
+                # before NetworkError, of which BadRequest is a subclass
+                error = e
+                break
+            except NetworkError as e:
+                # Timeouts and connection errors: back off exponentially
+                await asyncio.sleep(min(2 ** attempt, 30))
+                error = e
+            except TelegramError as e:
+                # Forbidden, ... retrying would not help
+                error = e
+                break
+            metrics.retried += 1
+
+        metrics.failed += 1
+        metrics.errors.append({'label': message.label, 'error': str(error)})
+        logger.error("Error sending reminder %s: %s", message.label, error)
+        return False
+
+    async def _worker(self, queue, metrics, on_delivered):
+        """Take messages from the queue until it is drained"""
+        while True:
+            message = await queue.get()
+            try:
+                await self._deliver(message, metrics, on_delivered)
+            except Exception as e:
+                metrics.failed += 1
+                metrics.errors.append({'label': message.label, 'error': str(e)})
+                logger.error("Unexpected error sending reminder %s: %s", message.label, e)
+            finally:
+                queue.task_done()
+
+    async def send_all(self, messages, on_delivered=None):
+        """
+        Deliver all messages and return a DispatchMetrics summary
+        The queue is bounded so large batches do not sit in memory all at once.
+        `on_delivered`, if given, is awaited with each message Telegram accepted.
+        """
+        # Buckets hold asyncio primitives, so build them on the running loop
+        self._global_bucket = TokenBucket(self.global_rate)
+        self._chat_buckets = {}
+
+        metrics = DispatchMetrics()
+        started = time.monotonic()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue, metrics, on_delivered))
+            for _ in range(self.concurrency)
+        ]
+        try:
+            for message in messages:
+                metrics.queued += 1
+                await queue.put(message)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        metrics.elapsed = time.monotonic() - started
+        logger.info(
+            "Dispatch finished: %d sent, %d failed, %d retries in %.2fs",
+            metrics.sent, metrics.failed, metrics.retried, metrics.elapsed
+        )
+        return metrics
@@ -0,0 +1,70 @@
+"""
+Bulk export of phone numbers and accounts as CSV or NDJSON
+
+Both formats are produced by generators that read the DataManager one page
+at a time, so exports use constant memory whatever the dataset size. The CSV
+layout matches the one accepted by importer.py.
+"""
+import csv
+import io
+import json
+
+from config import DEFAULT_TENANT_ID
+from importer import COLUMNS
+from utils import format_date
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+def iter_csv(data_manager, tenant_id=DEFAULT_TENANT_ID):
+    """Yield the export as CSV text, one row at a time (header first)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(COLUMNS)
+    yield flush()
+    for phone in data_manager.iter_phones(with_accounts=True, tenant_id=tenant_id):
+        renewal_date = format_date(phone['renewal_date'])
+        if not phone['accounts']:
+            writer.writerow((phone['phone_number'], renewal_date, '', ''))
+        for account in phone['accounts']:
+            writer.writerow((
+                phone['phone_number'],
+                renewal_date,
+                account['name'],
+                format_date(account['renewal_date'])
+            ))
+        yield flush()
+
+def iter_ndjson(data_manager, tenant_id=DEFAULT_TENANT_ID):
+    """Yield the export as NDJSON, one phone (with its accounts) per line"""
+    for phone in data_manager.iter_phones(with_accounts=True, tenant_id=tenant_id):
+        yield json.dumps({
+            'phone_number': phone['phone_number'],
+            'renewal_date': format_date(phone['renewal_date']),
+            'accounts': [
+                {'name': account['name'], 'renewal_date': format_date(account['renewal_date'])}
+                for account in phone['accounts']
+            ]
+        }, ensure_ascii=False) + '\n'
+
+def iter_export(data_manager, export_format, tenant_id=DEFAULT_TENANT_ID):
+    """Return the generator for the requested format"""
+    if export_format == 'csv':
+        return iter_csv(data_manager, tenant_id)
+    if export_format == 'ndjson':
+        return iter_ndjson(data_manager, tenant_id)
+    raise ValueError(f"Unsupported export format: {export_format}")
+
+def write_export(data_manager, export_format, file, tenant_id=DEFAULT_TENANT_ID):
+    """Stream the export into a binary file object"""
+    for chunk in iter_export(data_manager, export_format, tenant_id):
+        file.write(chunk.encode('utf-8'))
@@ -0,0 +1,164 @@
+"""
+Bulk import of phone numbers and accounts from CSV or Excel files
+
+Expected columns (header row required):
+    phone_number, renewal_date, account_name, account_renewal_date
+The account columns are optional; repeat a phone number on several rows to
+attach several accounts to it.
+"""
+import codecs
+import csv
+import io
+import logging
+from dataclasses import dataclass, field
+
+from config import DEFAULT_TENANT_ID
+from utils import canonical_phone_key, format_phone_key, parse_date
+
+try:
+    import openpyxl
+except ImportError:  # Excel support is optional
+    openpyxl = None
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('phone_number', 'renewal_date', 'account_name', 'account_renewal_date')
+
+@dataclass
+class ImportResult:
+    """Outcome of a bulk import"""
+    rows: int = 0
+    added_phones: int = 0
+    added_accounts: int = 0
+    errors: list = field(default_factory=list)
+
+    def as_dict(self):
+        """Return the result as a JSON-serializable dict"""
+        return {
+            'rows': self.rows,
+            'added_phones': self.added_phones,
+            'added_accounts': self.added_accounts,
+            'errors': [{'line': line, 'error': error} for line, error in self.errors],
+        }
+
+def read_csv_rows(stream):
+    """
+    Yield (line_number, row) pairs from a CSV byte or text stream
+    Rows are read lazily, so large files are never held in memory
+    """
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.BytesIO(stream)
+    if not isinstance(stream, io.TextIOBase):
+        stream = codecs.getreader('utf-8-sig')(stream)
+
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for row in reader:
+        yield reader.line_num, row
+
+def read_excel_rows(stream):
+    """Yield (line_number, row) pairs from the first sheet of an .xlsx file"""
+    if openpyxl is None:
+        raise ValueError("Excel import requires the openpyxl package; please upload a CSV file")
+    if isinstance(stream, (bytes, bytearray)):
+        stream = io.BytesIO(stream)
+
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(name or '').strip().lower() for name in header]
+        for line_number, values in enumerate(rows, 2):
+            yield line_number, {
+                name: '' if value is None else _excel_cell_to_str(value)
+                for name, value in zip(header, values)
+            }
+    finally:
+        workbook.close()
+
+def _excel_cell_to_str(value):
+    """Convert an Excel cell to the text form used in CSV files"""
+    if hasattr(value, 'strftime'):
+        return value.strftime("%d/%m/%Y")
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def read_rows(stream, filename=''):
+    """Pick the reader matching the file name"""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return read_excel_rows(stream)
+    return read_csv_rows(stream)
+
+def validate_row(row):
+    """
+    Validate one row and convert its dates
+    Returns (record, error) where exactly one of them is None
+    """
+    phone_number = (row.get('phone_number') or '').strip()
+    if not phone_number.startswith(('0', '+')) and phone_number.isdigit():
+        # Spreadsheets drop the leading zero of numbers stored as numbers
+        phone_number = '0' + phone_number
+    phone_key = canonical_phone_key(phone_number)
+    if phone_key is None:
+        return None, f"Số điện thoại không hợp lệ: {phone_number!r}"
+    phone_number = format_phone_key(phone_key)
+
+    try:
+        renewal_date = parse_date((row.get('renewal_date') or '').strip())
+    except ValueError:
+        return None, "Ngày gia hạn không hợp lệ, dùng định dạng DD/MM/YYYY"
+
+    record = {'phone_number': phone_number, 'renewal_date': renewal_date}
+
+    account_name = (row.get('account_name') or '').strip()
+    if account_name:
+        account_date_str = (row.get('account_renewal_date') or '').strip()
+        try:
+            record['account_renewal_date'] = parse_date(account_date_str) if account_date_str else renewal_date
+        except ValueError:
+            return None, "Ngày gia hạn tài khoản không hợp lệ, dùng định dạng DD/MM/YYYY"
+        record['account_name'] = account_name
+
+    return record, None
+
+def import_rows(data_manager, rows, tenant_id=DEFAULT_TENANT_ID):
+    """
+    Validate and store rows in a single streaming pass and one transaction
+    Invalid rows are skipped and reported; valid rows are still imported
+    """
+    result = ImportResult()
+    with data_manager.batch():
+        for line_number, row in rows:
+            result.rows += 1
+            record, error = validate_row(row)
+            if error:
+                result.errors.append((line_number, error))
+                continue
+
+            phone_number = record['phone_number']
+            if data_manager.add_phone(phone_number, record['renewal_date'], tenant_id=tenant_id):
+                result.added_phones += 1
+            elif 'account_name' not in record:
+                result.errors.append((line_number, f"Số điện thoại {phone_number} đã tồn tại"))
+                continue
+
+            if 'account_name' in record:
+                success, message = data_manager.add_account(
+                    phone_number, record['account_name'], record['account_renewal_date'],
+                    tenant_id=tenant_id
+                )
+                if success:
+                    result.added_accounts += 1
+                else:
+                    result.errors.append((line_number, message))
+
+    logger.info(
+        "Imported %d phones and %d accounts from %d rows (%d errors)",
+        result.added_phones, result.added_accounts, result.rows, len(result.errors)
+    )
+    return result
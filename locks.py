@@ -0,0 +1,54 @@
+"""
+Fine-grained asyncio locks for handlers that run concurrently
+"""
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+
+from utils import canonical_phone_key
+
+class KeyedLock:
+    """
+    One asyncio lock per key, created on demand and dropped once unused
+    Only tasks working on the same key wait for each other
+    """
+
+    def __init__(self):
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key):
+        """Hold the lock for `key` for the duration of the block"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+# Shared by every handler that reads and then modifies a phone number
+phone_locks = KeyedLock()
+
+def serialize_per_phone(handler):
+    """
+    Decorator for command handlers whose first argument is a phone number
+    Updates touching the same number of the same chat (tenant) run one after
+    the other, whichever way the number is spelled, while updates for other
+    numbers or chats keep running concurrently
+    """
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        if not context.args:
+            return await handler(update, context)
+        phone = canonical_phone_key(context.args[0]) or context.args[0]
+        async with phone_locks.hold((update.effective_chat.id, phone)):
+            return await handler(update, context)
+    return wrapper
@@ -3,14 +3,17 @@ Main application file - includes both Telegram bot and Flask web app
 This dual-mode file supports both:
 1. Running as a Telegram bot directly (if run with 'python main.py')
 2. Running as a Flask web application (if imported by Gunicorn)
+To serve the bot (via webhook) and the web app from one process, see server.py
 """
 import logging
 import sys
+import tempfile
 from datetime import datetime
 
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     CallbackContext,
@@ -18,10 +21,44 @@ from telegram.ext import (
     filters
 )
 
-from config import BOT_TOKEN, ADMIN_CHAT_ID, HELP_TEXT, MAX_ACCOUNTS_PER_NUMBER
+from config import (
+    BOT_TOKEN,
+    ALLOW_ALL_TENANTS,
+    ALLOWED_TENANT_IDS,
+    DEFAULT_TENANT_ID,
+    BOT_RUN_MODE,
+    CONCURRENT_UPDATES,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET_TOKEN,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    HELP_TEXT,
+    MAX_ACCOUNTS_PER_NUMBER,
+    MAX_MESSAGE_LENGTH,
+    MAX_REMINDER_OFFSET_DAYS,
+    PER_CHAT_MESSAGES_PER_SECOND,
+    PHONES_PAGE_SIZE,
+    SEARCH_RESULT_LIMIT,
+    SEARCH_MAX_RESULTS,
+    STREAM_PAGE_SIZE,
+    API_MAX_PAGE_SIZE,
+    IMPORT_ERRORS_SHOWN,
+    IMPORT_FILE_EXTENSIONS,
+    TENANT_API_TOKENS,
+)
+from async_data_manager import AsyncDataManager
 from data_manager import DataManager
+from dispatcher import TokenBucket, send_with_retry
+from exporter import EXPORT_FORMATS, iter_export, write_export
+from importer import import_rows, read_rows
+from locks import serialize_per_phone
+from metrics import REGISTRY, CONTENT_TYPE, instrument_flask, timed_handler
+from render_cache import MISSING, RenderCache
 from scheduler import ReminderScheduler
-from utils import validate_phone_number, validate_date_format, parse_date, format_date
+from utils import (
+    canonical_phone_key, format_phone_key, parse_date, parse_offsets, format_date, chunk_blocks
+)
 
 # Configure logging
 logging.basicConfig(
@@ -30,8 +67,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize data manager
+# Initialize data manager; bot handlers go through the async facade so
+# storage I/O runs on a thread pool instead of the event loop
 data_manager = DataManager()
+async_data_manager = AsyncDataManager(data_manager)
+
+# Rendered replies and pages, reused until the dataset version changes
+phone_list_cache = RenderCache('phone_list')
+account_list_cache = RenderCache('account_list')
+page_cache = RenderCache('web_pages')
+
+def get_tenant_id(chat_id):
+    """
+    Return the tenant (dataset) of a chat, or None if the chat may not use the bot
+    Every chat works on its own phones and accounts, keyed by its chat id
+    """
+    if ALLOW_ALL_TENANTS or chat_id in ALLOWED_TENANT_IDS:
+        return chat_id
+    return None
 
 # Command handlers
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -47,9 +100,21 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     """Send a message when the command /help is issued"""
     await update.message.reply_text(HELP_TEXT)
 
+async def _phone_key_arg(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Canonical key of the phone number given as the first command argument
+    Replies with an error and returns None if the number is not valid
+    """
+    phone_key = canonical_phone_key(context.args[0])
+    if phone_key is None:
+        await update.message.reply_text("❌ Số điện thoại không hợp lệ.")
+    return phone_key
+
+@serialize_per_phone
 async def add_phone_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Add a new phone number with renewal date"""
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
@@ -70,67 +135,144 @@ async def add_phone_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             )
         return
     
-    phone_number = context.args[0]
-    renewal_date_str = context.args[1]
-    
-    # Validate phone number
-    if not validate_phone_number(phone_number):
-        await update.message.reply_text("❌ Số điện thoại không hợp lệ.")
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
         return
+    phone_number = format_phone_key(phone_key)
+    renewal_date_str = context.args[1]
     
-    # Validate date format
-    if not validate_date_format(renewal_date_str):
+    # Parse and validate the date in a single pass
+    try:
+        renewal_date = parse_date(renewal_date_str)
+    except ValueError:
         await update.message.reply_text(
             "❌ Định dạng ngày không hợp lệ. Vui lòng sử dụng định dạng DD/MM/YYYY."
         )
         return
     
-    try:
-        # Parse the date string to datetime object
-        renewal_date = parse_date(renewal_date_str)
-        
-        # Add the phone number
-        success = data_manager.add_phone(phone_number, renewal_date)
-        
-        if success:
-            await update.message.reply_text(
-                f"✅ Đã thêm số điện thoại {phone_number} với ngày gia hạn {renewal_date_str}."
-            )
-        else:
-            await update.message.reply_text(
-                f"❌ Số điện thoại {phone_number} đã tồn tại."
-            )
+    # Add the phone number
+    success = await async_data_manager.add_phone(phone_key, renewal_date, tenant_id=tenant_id)
     
-    except ValueError as e:
-        await update.message.reply_text(f"❌ Lỗi: {str(e)}")
+    if success:
+        await update.message.reply_text(
+            f"✅ Đã thêm số điện thoại {phone_number} với ngày gia hạn {renewal_date_str}."
+        )
+    else:
+        await update.message.reply_text(
+            f"❌ Số điện thoại {phone_number} đã tồn tại."
+        )
+
+def _format_phone_block(phone):
+    """Format one phone entry for the phone list"""
+    return (
+        f"{phone['phone_number']}\n"
+        f"📅 Ngày gia hạn: {format_date(phone['renewal_date'])}\n"
+        f"👤 Số tài khoản: {phone['account_count']}/{MAX_ACCOUNTS_PER_NUMBER}"
+    )
+
+async def _build_phones_page(tenant_id, after=None, before=None):
+    """
+    Build the text and navigation keyboard for one page of the phone list
+    Returns (text, reply_markup), or (None, None) if there are no phones.
+    Pages are served from phone_list_cache until the dataset changes.
+    """
+    version = await async_data_manager.get_version()
+    key = (tenant_id, after, before)
+    page = phone_list_cache.get(key, version)
+    if page is MISSING:
+        page = await _render_phones_page(tenant_id, after, before)
+        phone_list_cache.put(key, version, page)
+    return page
+
+async def _render_phones_page(tenant_id, after, before):
+    """Load one page of phones and format it (see _build_phones_page)"""
+    phones, has_prev, has_next = await async_data_manager.get_phones_page(
+        after=after, before=before, limit=PHONES_PAGE_SIZE, tenant_id=tenant_id
+    )
+    if not phones:
+        return None, None
+    
+    message = "📱 DANH SÁCH SỐ ĐIỆN THOẠI\n\n"
+    message += "\n\n".join(_format_phone_block(phone) for phone in phones)
+    
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton("⬅️ Trang trước", callback_data=f"phones:prev:{phones[0]['phone_number']}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton("Trang sau ➡️", callback_data=f"phones:next:{phones[-1]['phone_number']}"))
+    
+    return message, InlineKeyboardMarkup([buttons]) if buttons else None
 
 async def list_phones_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """List all phone numbers with their renewal dates"""
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    """
+    List phone numbers with their renewal dates
+    Shows one page with next/prev buttons; '/danhsachso all' streams the whole
+    list as a sequence of messages sized to Telegram's limit
+    """
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
-    phones = data_manager.get_all_phones()
+    if context.args and context.args[0].lower() in ('all', 'tatca'):
+        # Fetch one page at a time and send every full message straight away;
+        # the last, partly filled chunk is carried over to the next page.
+        # Messages are paced to the chat's rate limit, so long lists are not
+        # cut short by flood control.
+        bucket = TokenBucket(PER_CHAT_MESSAGES_PER_SECOND)
+        after = None
+        carry = ["📱 DANH SÁCH SỐ ĐIỆN THOẠI"]
+        while True:
+            phones, _, has_next = await async_data_manager.get_phones_page(
+                after=after, limit=STREAM_PAGE_SIZE, tenant_id=tenant_id
+            )
+            if after is None and not phones:
+                await update.message.reply_text("📱 Không có số điện thoại nào trong danh sách.")
+                return
+            chunks = list(chunk_blocks(carry + [_format_phone_block(phone) for phone in phones], MAX_MESSAGE_LENGTH))
+            carry = chunks[-1:]
+            for chunk in chunks[:-1]:
+                await send_with_retry(lambda: update.message.reply_text(chunk), bucket)
+            if not has_next:
+                break
+            after = phones[-1]['phone_number']
+        for chunk in carry:
+            await send_with_retry(lambda: update.message.reply_text(chunk), bucket)
+        return
     
-    if not phones:
+    message, reply_markup = await _build_phones_page(tenant_id)
+    if message is None:
         await update.message.reply_text("📱 Không có số điện thoại nào trong danh sách.")
         return
     
-    message = "📱 DANH SÁCH SỐ ĐIỆN THOẠI\n\n"
+    await update.message.reply_text(message, reply_markup=reply_markup)
+
+async def list_phones_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the next/prev buttons of the phone list"""
+    query = update.callback_query
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
+        await query.answer("❌ Bạn không có quyền sử dụng lệnh này.")
+        return
     
-    for phone, data in phones.items():
-        renewal_date = format_date(data['renewal_date'])
-        account_count = len(data['accounts'])
-        
-        message += f"{phone}\n"
-        message += f"📅 Ngày gia hạn: {renewal_date}\n"
-        message += f"👤 Số tài khoản: {account_count}/3\n\n"
+    await query.answer()
+    _, direction, cursor = query.data.split(':', 2)
+    if direction == 'next':
+        message, reply_markup = await _build_phones_page(tenant_id, after=cursor)
+    else:
+        message, reply_markup = await _build_phones_page(tenant_id, before=cursor)
     
-    await update.message.reply_text(message)
+    if message is None:
+        await query.edit_message_text("📱 Không có số điện thoại nào trong danh sách.")
+        return
+    
+    await query.edit_message_text(message, reply_markup=reply_markup)
 
+@serialize_per_phone
 async def delete_phone_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Delete a phone number"""
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
@@ -151,24 +293,29 @@ async def delete_phone_command(update: Update, context: ContextTypes.DEFAULT_TYP
             )
         return
     
-    phone_number = context.args[0]
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
+        return
+    phone_number = format_phone_key(phone_key)
     
     # Check if phone exists before deleting
-    if data_manager.get_phone(phone_number) is None:
+    if await async_data_manager.get_phone(phone_key, tenant_id=tenant_id) is None:
         await update.message.reply_text(f"❌ Số điện thoại {phone_number} không tồn tại.")
         return
     
     # Confirm and delete
-    success = data_manager.delete_phone(phone_number)
+    success = await async_data_manager.delete_phone(phone_key, tenant_id=tenant_id)
     
     if success:
         await update.message.reply_text(f"✅ Đã xóa số điện thoại {phone_number} và tất cả tài khoản liên kết.")
     else:
         await update.message.reply_text(f"❌ Không thể xóa số điện thoại {phone_number}.")
 
+@serialize_per_phone
 async def edit_phone_date_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Edit renewal date for a phone number"""
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
@@ -189,44 +336,41 @@ async def edit_phone_date_command(update: Update, context: ContextTypes.DEFAULT_
             )
         return
     
-    phone_number = context.args[0]
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
+        return
+    phone_number = format_phone_key(phone_key)
     new_date_str = context.args[1]
     
     # Check if phone exists
-    if data_manager.get_phone(phone_number) is None:
+    if await async_data_manager.get_phone(phone_key, tenant_id=tenant_id) is None:
         await update.message.reply_text(f"❌ Số điện thoại {phone_number} không tồn tại.")
         return
     
-    # Validate date format
-    if not validate_date_format(new_date_str):
+    # Parse and validate the date in a single pass
+    try:
+        new_date = parse_date(new_date_str)
+    except ValueError:
         await update.message.reply_text(
             "❌ Định dạng ngày không hợp lệ. Vui lòng sử dụng định dạng DD/MM/YYYY."
         )
         return
     
-    try:
-        # Parse the date string to datetime object
-        new_date = parse_date(new_date_str)
-        
-        # Update the phone renewal date
-        success = data_manager.update_phone_renewal(phone_number, new_date)
-        
-        if success:
-            await update.message.reply_text(
-                f"✅ Đã cập nhật ngày gia hạn cho số {phone_number} thành {new_date_str}."
-            )
-        else:
-            await update.message.reply_text(f"❌ Không thể cập nhật ngày gia hạn cho số {phone_number}.")
+    # Update the phone renewal date
+    success = await async_data_manager.update_phone_renewal(phone_key, new_date, tenant_id=tenant_id)
     
-    except ValueError as e:
-        await update.message.reply_text(f"❌ Lỗi: {str(e)}")
+    if success:
+        await update.message.reply_text(
+            f"✅ Đã cập nhật ngày gia hạn cho số {phone_number} thành {new_date_str}."
+        )
+    else:
+        await update.message.reply_text(f"❌ Không thể cập nhật ngày gia hạn cho số {phone_number}.")
 
+@serialize_per_phone
 async def add_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Add an account to a phone number"""
-    logger.info(f"Processing add_account command: {update.message.text}")
-    logger.info(f"Args: {context.args}")
-    
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
@@ -234,7 +378,7 @@ async def add_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     if len(context.args) < 3:
         # Kiểm tra lệnh nào được sử dụng (tiếng Anh hay tiếng Việt)
         command = update.message.text.split()[0]
-        logger.info(f"Command with insufficient args: {command}")
+        logger.debug("add_account with insufficient args: %s", command)
         if '/themtk' in command:
             await update.message.reply_text(
                 "❌ Sai cú pháp. Vui lòng sử dụng:\n"
@@ -249,44 +393,41 @@ async def add_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
         return
     
-    phone_number = context.args[0]
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
+        return
+    phone_number = format_phone_key(phone_key)
     account_name = context.args[1]
     renewal_date_str = context.args[2]
     
-    logger.info(f"Adding account: Phone={phone_number}, Account={account_name}, Date={renewal_date_str}")
-    
     # Check if phone exists
-    if data_manager.get_phone(phone_number) is None:
+    if await async_data_manager.get_phone(phone_key, tenant_id=tenant_id) is None:
         await update.message.reply_text(f"❌ Số điện thoại {phone_number} không tồn tại.")
         return
     
-    # Validate date format
-    if not validate_date_format(renewal_date_str):
+    # Parse and validate the date in a single pass
+    try:
+        renewal_date = parse_date(renewal_date_str)
+    except ValueError:
         await update.message.reply_text(
             "❌ Định dạng ngày không hợp lệ. Vui lòng sử dụng định dạng DD/MM/YYYY."
         )
         return
     
-    try:
-        # Parse the date string to datetime object
-        renewal_date = parse_date(renewal_date_str)
-        
-        # Add the account
-        logger.info(f"Calling data_manager.add_account with: {phone_number}, {account_name}, {renewal_date}")
-        success, message = data_manager.add_account(phone_number, account_name, renewal_date)
-        logger.info(f"Result: success={success}, message={message}")
-        
-        await update.message.reply_text(
-            f"{'✅' if success else '❌'} {message}"
-        )
+    # Add the account
+    success, message = await async_data_manager.add_account(
+        phone_key, account_name, renewal_date, tenant_id=tenant_id
+    )
+    logger.debug("add_account %s %s %s: success=%s", phone_number, account_name, renewal_date_str, success)
     
-    except ValueError as e:
-        logger.error(f"Error adding account: {str(e)}")
-        await update.message.reply_text(f"❌ Lỗi: {str(e)}")
+    await update.message.reply_text(
+        f"{'✅' if success else '❌'} {message}"
+    )
 
 async def list_accounts_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """List all accounts for a phone number"""
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
@@ -308,19 +449,29 @@ async def list_accounts_command(update: Update, context: ContextTypes.DEFAULT_TY
             )
         return
     
-    phone_number = context.args[0]
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
+        return
+    
+    version = await async_data_manager.get_version()
+    message = account_list_cache.get((tenant_id, phone_key), version)
+    if message is MISSING:
+        message = await _render_accounts_reply(tenant_id, phone_key)
+        account_list_cache.put((tenant_id, phone_key), version, message)
     
-    # Check if phone exists
-    phone_data = data_manager.get_phone(phone_number)
+    await update.message.reply_text(message)
+
+async def _render_accounts_reply(tenant_id, phone_key):
+    """Text of the account list of a phone number (or why there is none)"""
+    phone_number = format_phone_key(phone_key)
+    phone_data = await async_data_manager.get_phone(phone_key, tenant_id=tenant_id)
     if phone_data is None:
-        await update.message.reply_text(f"❌ Số điện thoại {phone_number} không tồn tại.")
-        return
+        return f"❌ Số điện thoại {phone_number} không tồn tại."
     
     accounts = phone_data.get('accounts', [])
     
     if not accounts:
-        await update.message.reply_text(f"📱 Số điện thoại {phone_number} chưa có tài khoản nào.")
-        return
+        return f"📱 Số điện thoại {phone_number} chưa có tài khoản nào."
     
     message = f"👤 TÀI KHOẢN CỦA SỐ {phone_number}\n\n"
     
@@ -331,11 +482,13 @@ async def list_accounts_command(update: Update, context: ContextTypes.DEFAULT_TY
         message += f"{i}. {account_name}\n"
         message += f"📅 Ngày gia hạn: {renewal_date}\n\n"
     
-    await update.message.reply_text(message)
+    return message
 
+@serialize_per_phone
 async def delete_account_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Delete an account from a phone number"""
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
@@ -356,19 +509,23 @@ async def delete_account_command(update: Update, context: ContextTypes.DEFAULT_T
             )
         return
     
-    phone_number = context.args[0]
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
+        return
     account_name = context.args[1]
     
     # Delete account
-    success, message = data_manager.delete_account(phone_number, account_name)
+    success, message = await async_data_manager.delete_account(phone_key, account_name, tenant_id=tenant_id)
     
     await update.message.reply_text(
         f"{'✅' if success else '❌'} {message}"
     )
 
+@serialize_per_phone
 async def edit_account_date_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Edit renewal date for an account"""
-    if str(update.effective_chat.id) != ADMIN_CHAT_ID:
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
         await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
         return
     
@@ -389,30 +546,186 @@ async def edit_account_date_command(update: Update, context: ContextTypes.DEFAUL
             )
         return
     
-    phone_number = context.args[0]
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
+        return
     account_name = context.args[1]
     new_date_str = context.args[2]
     
-    # Validate date format
-    if not validate_date_format(new_date_str):
+    # Parse and validate the date in a single pass
+    try:
+        new_date = parse_date(new_date_str)
+    except ValueError:
         await update.message.reply_text(
             "❌ Định dạng ngày không hợp lệ. Vui lòng sử dụng định dạng DD/MM/YYYY."
         )
         return
     
-    try:
-        # Parse the date string to datetime object
-        new_date = parse_date(new_date_str)
-        
-        # Update the account renewal date
-        success, message = data_manager.update_account_renewal(phone_number, account_name, new_date)
-        
+    # Update the account renewal date
+    success, message = await async_data_manager.update_account_renewal(
+        phone_key, account_name, new_date, tenant_id=tenant_id
+    )
+    
+    await update.message.reply_text(
+        f"{'✅' if success else '❌'} {message}"
+    )
+
+@serialize_per_phone
+async def reminder_schedule_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Set the reminder offsets of a phone number or account"""
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
+        await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
+        return
+    
+    # Check if correct arguments are provided
+    if len(context.args) not in (2, 3):
+        command = update.message.text.split()[0]
+        if '/nhacnho' in command:
+            await update.message.reply_text(
+                "❌ Sai cú pháp. Vui lòng sử dụng:\n"
+                "/nhacnho <số điện thoại> [tên tài khoản] <số ngày,...|macdinh>\n"
+                "Ví dụ: /nhacnho 0912345678 Facebook 7,3,1"
+            )
+        else:
+            await update.message.reply_text(
+                "❌ Sai cú pháp. Vui lòng sử dụng:\n"
+                "/set_reminders <số điện thoại> [tên tài khoản] <số ngày,...|default>\n"
+                "Ví dụ: /set_reminders 0912345678 Facebook 7,3,1"
+            )
+        return
+    
+    phone_key = await _phone_key_arg(update, context)
+    if phone_key is None:
+        return
+    account_name = context.args[1] if len(context.args) == 3 else None
+    offsets_str = context.args[-1]
+    
+    if offsets_str.lower() in ('macdinh', 'default'):
+        offsets = ()
+    else:
+        try:
+            offsets = parse_offsets(offsets_str, MAX_REMINDER_OFFSET_DAYS)
+        except ValueError:
+            await update.message.reply_text(
+                "❌ Lịch nhắc không hợp lệ. Vui lòng nhập các số ngày cách nhau bởi dấu phẩy, "
+                f"từ 0 đến {MAX_REMINDER_OFFSET_DAYS} (ví dụ: 7,3,1)."
+            )
+            return
+    
+    success, message = await async_data_manager.set_reminder_offsets(
+        phone_key, account_name, offsets, tenant_id=tenant_id
+    )
+    
+    await update.message.reply_text(
+        f"{'✅' if success else '❌'} {message}"
+    )
+
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Bulk import phones and accounts from a CSV/Excel file sent as a document"""
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
+        await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
+        return
+    
+    document = update.message.document
+    filename = document.file_name or ''
+    if not filename.lower().endswith(IMPORT_FILE_EXTENSIONS):
         await update.message.reply_text(
-            f"{'✅' if success else '❌'} {message}"
+            "❌ Chỉ hỗ trợ nhập file CSV hoặc Excel (.csv, .xlsx)."
         )
+        return
     
+    telegram_file = await document.get_file()
+    content = await telegram_file.download_as_bytearray()
+    
+    try:
+        result = await async_data_manager.run(
+            import_rows, data_manager, read_rows(content, filename), tenant_id=tenant_id
+        )
     except ValueError as e:
         await update.message.reply_text(f"❌ Lỗi: {str(e)}")
+        return
+    
+    message = (
+        f"📥 KẾT QUẢ NHẬP FILE {filename}\n\n"
+        f"Số dòng: {result.rows}\n"
+        f"✅ Số điện thoại đã thêm: {result.added_phones}\n"
+        f"✅ Tài khoản đã thêm: {result.added_accounts}\n"
+        f"❌ Dòng lỗi: {len(result.errors)}"
+    )
+    if result.errors:
+        message += "\n\n" + "\n".join(
+            f"Dòng {line}: {error}" for line, error in result.errors[:IMPORT_ERRORS_SHOWN]
+        )
+        if len(result.errors) > IMPORT_ERRORS_SHOWN:
+            message += f"\n... và {len(result.errors) - IMPORT_ERRORS_SHOWN} lỗi khác"
+    
+    for chunk in chunk_blocks([message], MAX_MESSAGE_LENGTH):
+        await update.message.reply_text(chunk)
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Send the whole dataset as a CSV (default) or NDJSON file"""
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
+        await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
+        return
+    
+    export_format = context.args[0].lower() if context.args else 'csv'
+    if export_format not in EXPORT_FORMATS:
+        await update.message.reply_text(
+            "❌ Sai cú pháp. Vui lòng sử dụng:\n"
+            "/xuat [csv|ndjson]\n"
+            "Ví dụ: /xuat csv"
+        )
+        return
+    
+    _, extension = EXPORT_FORMATS[export_format]
+    filename = f"danhsach_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    
+    # Write the file on the storage thread pool so the export does not block the bot loop
+    with tempfile.TemporaryFile() as file:
+        await async_data_manager.run(write_export, data_manager, export_format, file, tenant_id=tenant_id)
+        file.seek(0)
+        await update.message.reply_document(document=file, filename=filename)
+
+def _format_search_result(result):
+    """Format one search hit for the /timkiem reply"""
+    if result['type'] == 'account':
+        return (
+            f"👤 {result['account_name']} - {result['phone_number']}\n"
+            f"📅 Ngày gia hạn: {format_date(result['renewal_date'])}"
+        )
+    return (
+        f"📱 {result['phone_number']}\n"
+        f"📅 Ngày gia hạn: {format_date(result['renewal_date'])}"
+    )
+
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Search phones by part of the number and accounts by (part of) the name"""
+    tenant_id = get_tenant_id(update.effective_chat.id)
+    if tenant_id is None:
+        await update.message.reply_text("❌ Bạn không có quyền sử dụng lệnh này.")
+        return
+    
+    if not context.args:
+        command = update.message.text.split()[0]
+        await update.message.reply_text(
+            "❌ Sai cú pháp. Vui lòng sử dụng:\n"
+            f"{'/timkiem' if '/timkiem' in command else '/search'} <một phần số điện thoại hoặc tên tài khoản>\n"
+            "Ví dụ: /timkiem 0912 hoặc /timkiem facebook"
+        )
+        return
+    
+    query = " ".join(context.args)
+    results = await async_data_manager.search(query, limit=SEARCH_RESULT_LIMIT, tenant_id=tenant_id)
+    if not results:
+        await update.message.reply_text(f"🔍 Không tìm thấy kết quả nào cho \"{query}\".")
+        return
+    
+    header = f"🔍 KẾT QUẢ TÌM KIẾM \"{query}\" ({len(results)})"
+    for chunk in chunk_blocks([header] + [_format_search_result(result) for result in results], MAX_MESSAGE_LENGTH):
+        await update.message.reply_text(chunk)
 
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Respond to unknown commands"""
@@ -420,86 +733,137 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         "❓ Lệnh không được nhận dạng. Gõ /help để xem danh sách lệnh."
     )
 
-def main() -> None:
-    """Start the bot"""
+async def post_init(application: Application) -> None:
+    """Start the reminder scheduler once the bot's event loop is running"""
+    reminder_scheduler = ReminderScheduler(application.bot, data_manager)
+    reminder_scheduler.start()
+    application.bot_data['reminder_scheduler'] = reminder_scheduler
+
+async def post_shutdown(application: Application) -> None:
+    """Stop the reminder scheduler when the bot is stopped"""
+    reminder_scheduler = application.bot_data.get('reminder_scheduler')
+    if reminder_scheduler is not None:
+        reminder_scheduler.stop()
+
+def build_application() -> Application:
+    """Create the bot Application with all handlers registered"""
     # Create the Application and pass it your bot's token
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # Add command handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("start", timed_handler(start_command)))
+    application.add_handler(CommandHandler("help", timed_handler(help_command)))
     # Lệnh tiếng Anh
-    application.add_handler(CommandHandler("add_phone", add_phone_command))
-    application.add_handler(CommandHandler("list_phones", list_phones_command))
-    application.add_handler(CommandHandler("delete_phone", delete_phone_command))
-    application.add_handler(CommandHandler("edit_phone_date", edit_phone_date_command))
-    application.add_handler(CommandHandler("add_account", add_account_command))
-    application.add_handler(CommandHandler("list_accounts", list_accounts_command))
-    application.add_handler(CommandHandler("delete_account", delete_account_command))
-    application.add_handler(CommandHandler("edit_account_date", edit_account_date_command))
+    application.add_handler(CommandHandler("add_phone", timed_handler(add_phone_command)))
+    application.add_handler(CommandHandler("list_phones", timed_handler(list_phones_command)))
+    application.add_handler(CommandHandler("delete_phone", timed_handler(delete_phone_command)))
+    application.add_handler(CommandHandler("edit_phone_date", timed_handler(edit_phone_date_command)))
+    application.add_handler(CommandHandler("add_account", timed_handler(add_account_command)))
+    application.add_handler(CommandHandler("list_accounts", timed_handler(list_accounts_command)))
+    application.add_handler(CommandHandler("delete_account", timed_handler(delete_account_command)))
+    application.add_handler(CommandHandler("edit_account_date", timed_handler(edit_account_date_command)))
+    application.add_handler(CommandHandler("set_reminders", timed_handler(reminder_schedule_command)))
+    application.add_handler(CommandHandler("export", timed_handler(export_command)))
+    application.add_handler(CommandHandler("search", timed_handler(search_command)))
     # Lệnh tiếng Việt
-    application.add_handler(CommandHandler("themso", add_phone_command))
-    application.add_handler(CommandHandler("danhsachso", list_phones_command))
-    application.add_handler(CommandHandler("xoaso", delete_phone_command))
-    application.add_handler(CommandHandler("suaso", edit_phone_date_command))
-    application.add_handler(CommandHandler("themtk", add_account_command))
-    application.add_handler(CommandHandler("danhsachtk", list_accounts_command))
-    application.add_handler(CommandHandler("xoatk", delete_account_command))
-    application.add_handler(CommandHandler("suatk", edit_account_date_command))
+    application.add_handler(CommandHandler("themso", timed_handler(add_phone_command)))
+    application.add_handler(CommandHandler("danhsachso", timed_handler(list_phones_command)))
+    application.add_handler(CommandHandler("xoaso", timed_handler(delete_phone_command)))
+    application.add_handler(CommandHandler("suaso", timed_handler(edit_phone_date_command)))
+    application.add_handler(CommandHandler("themtk", timed_handler(add_account_command)))
+    application.add_handler(CommandHandler("danhsachtk", timed_handler(list_accounts_command)))
+    application.add_handler(CommandHandler("xoatk", timed_handler(delete_account_command)))
+    application.add_handler(CommandHandler("suatk", timed_handler(edit_account_date_command)))
+    application.add_handler(CommandHandler("nhacnho", timed_handler(reminder_schedule_command)))
+    application.add_handler(CommandHandler("xuat", timed_handler(export_command)))
+    application.add_handler(CommandHandler("timkiem", timed_handler(search_command)))
     
-    # Handle unknown commands
-    application.add_handler(MessageHandler(filters.COMMAND, unknown_command))
+    # Bulk import from CSV/Excel documents
+    application.add_handler(MessageHandler(filters.Document.ALL, timed_handler(import_document)))
     
-    # Initialize and start the scheduler
-    reminder_scheduler = ReminderScheduler(application.bot, data_manager)
-    reminder_scheduler.start()
+    # Phone list navigation buttons
+    application.add_handler(CallbackQueryHandler(timed_handler(list_phones_page_callback), pattern=r'^phones:'))
     
-    # Start the Bot
-    application.run_polling()
+    # Handle unknown commands
+    application.add_handler(MessageHandler(filters.COMMAND, timed_handler(unknown_command)))
     
-    # Stop the scheduler when the bot is stopped
-    reminder_scheduler.stop()
+    return application
+
+def main() -> None:
+    """
+    Start the bot
+    BOT_RUN_MODE=webhook receives updates on a local HTTP server instead of
+    long polling; Telegram must be able to reach WEBHOOK_URL
+    """
+    application = build_application()
+    
+    # Start the Bot; the reminder scheduler runs on the same event loop
+    if BOT_RUN_MODE == 'webhook':
+        if not WEBHOOK_URL:
+            logger.error("BOT_RUN_MODE=webhook requires WEBHOOK_URL to be set")
+            sys.exit(1)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH.lstrip('/'),
+            webhook_url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET_TOKEN,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling()
 
 # Flask web application code
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import (
+    Flask, Response, abort, render_template, request, redirect, session, url_for, flash, jsonify,
+    make_response, stream_with_context
+)
+import hashlib
+import hmac
+import json
 import os
+import shutil
 
 # Create Flask app instance for use with Gunicorn
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
+instrument_flask(app)
 
 # Routes for adding and managing phones via web interface
 @app.route('/add_phone', methods=['POST'])
 def add_phone():
     """Add a new phone number via web interface"""
     if request.method == 'POST':
-        phone_number = request.form.get('phone_number')
+        phone_key = canonical_phone_key(request.form.get('phone_number') or '')
         renewal_date_str = request.form.get('renewal_date')
         
         # Validate phone number
-        if not validate_phone_number(phone_number):
+        if phone_key is None:
             flash('Số điện thoại không hợp lệ', 'danger')
             return redirect(url_for('index'))
+        phone_number = format_phone_key(phone_key)
         
-        # Validate date format
-        if not validate_date_format(renewal_date_str):
+        # Parse and validate the date in a single pass
+        try:
+            renewal_date = parse_date(renewal_date_str or '')
+        except ValueError:
             flash('Định dạng ngày không hợp lệ. Vui lòng sử dụng định dạng DD/MM/YYYY', 'danger')
             return redirect(url_for('index'))
         
-        try:
-            # Parse the date string to datetime object
-            renewal_date = parse_date(renewal_date_str)
-            
-            # Add the phone number
-            success = data_manager.add_phone(phone_number, renewal_date)
-            
-            if success:
-                flash(f'Đã thêm số điện thoại {phone_number} với ngày gia hạn {renewal_date_str}', 'success')
-            else:
-                flash(f'Số điện thoại {phone_number} đã tồn tại', 'warning')
-            
-        except ValueError as e:
-            flash(f'Lỗi: {str(e)}', 'danger')
+        # Add the phone number
+        success = data_manager.add_phone(phone_key, renewal_date)
+        
+        if success:
+            flash(f'Đã thêm số điện thoại {phone_number} với ngày gia hạn {renewal_date_str}', 'success')
+        else:
+            flash(f'Số điện thoại {phone_number} đã tồn tại', 'warning')
         
         return redirect(url_for('index'))
 
@@ -507,79 +871,247 @@ def add_phone():
 def add_account():
     """Add a new account to a phone number via web interface"""
     if request.method == 'POST':
-        phone_number = request.form.get('phone_number')
+        phone_number = request.form.get('phone_number') or ''
         account_name = request.form.get('account_name')
         renewal_date_str = request.form.get('renewal_date')
         
         # Check if phone exists
-        if data_manager.get_phone(phone_number) is None:
+        phone_key = canonical_phone_key(phone_number)
+        if phone_key is None or data_manager.get_phone(phone_key) is None:
             flash(f'Số điện thoại {phone_number} không tồn tại', 'danger')
             return redirect(url_for('index'))
+        phone_number = format_phone_key(phone_key)
         
-        # Validate date format
-        if not validate_date_format(renewal_date_str):
+        # Parse and validate the date in a single pass
+        try:
+            renewal_date = parse_date(renewal_date_str or '')
+        except ValueError:
             flash('Định dạng ngày không hợp lệ. Vui lòng sử dụng định dạng DD/MM/YYYY', 'danger')
             return redirect(url_for('phone_detail', phone_number=phone_number))
         
-        try:
-            # Parse the date string to datetime object
-            renewal_date = parse_date(renewal_date_str)
-            
-            # Add the account
-            success, message = data_manager.add_account(phone_number, account_name, renewal_date)
-            
-            if success:
-                flash(message, 'success')
-            else:
-                flash(message, 'warning')
-            
-        except ValueError as e:
-            flash(f'Lỗi: {str(e)}', 'danger')
+        # Add the account
+        success, message = data_manager.add_account(phone_key, account_name, renewal_date)
+        
+        if success:
+            flash(message, 'success')
+        else:
+            flash(message, 'warning')
         
         return redirect(url_for('phone_detail', phone_number=phone_number))
 
+def _cached_page(key, render):
+    """
+    Serve a rendered page from page_cache, rendering it on a miss
+    Pages are rendered fresh while flash messages are pending, since those are
+    part of the page and consumed by rendering it.
+    """
+    if session.get('_flashes'):
+        return render()
+    return page_cache.get_or_render(key, data_manager.get_version(), render)
+
 @app.route('/')
 def index():
     """Home page - show all phone numbers"""
-    phones = data_manager.get_all_phones()
-    return render_template('index.html', phones=phones, format_date=format_date)
+    def render():
+        phones = data_manager.get_all_phones()
+        return render_template('index.html', phones=phones, format_date=format_date)
+    return _cached_page(('index',), render)
 
 @app.route('/phone/<phone_number>')
 def phone_detail(phone_number):
     """Detail page for a specific phone number"""
-    phone_data = data_manager.get_phone(phone_number)
-    if not phone_data:
+    phone_key = canonical_phone_key(phone_number)
+    
+    def render():
+        phone_data = data_manager.get_phone(phone_key)
+        if not phone_data:
+            return None
+        return render_template(
+            'phone_detail.html', phone_number=phone_data.phone_number, phone_data=phone_data, format_date=format_date
+        )
+    
+    page = _cached_page(('phone', phone_key), render) if phone_key is not None else None
+    if page is None:
         flash('Số điện thoại không tồn tại', 'danger')
         return redirect(url_for('index'))
-        
-    return render_template('phone_detail.html', phone_number=phone_number, phone_data=phone_data, format_date=format_date)
+    return page
+
+def _request_tenant_id():
+    """
+    Tenant selected by the ?tenant=<chat id> parameter of an API request
+    Tenants other than DEFAULT_TENANT_ID require their token from
+    TENANT_API_TOKENS in the X-API-Token header; other requests get a 403.
+    """
+    tenant_id = request.args.get('tenant', default=DEFAULT_TENANT_ID, type=int)
+    if tenant_id != DEFAULT_TENANT_ID:
+        expected = TENANT_API_TOKENS.get(tenant_id)
+        token = request.headers.get('X-API-Token', '')
+        if expected is None or not hmac.compare_digest(token.encode(), expected.encode()):
+            abort(make_response(jsonify({'error': 'Invalid or missing API token for this tenant'}), 403))
+    return tenant_id
+
+def _serialize_phone(phone):
+    """Convert a phone dict into its JSON-serializable form"""
+    return {
+        'renewal_date': format_date(phone['renewal_date']),
+        'accounts': [
+            {'name': account['name'], 'renewal_date': format_date(account['renewal_date'])}
+            for account in phone.get('accounts', [])
+        ]
+    }
 
 @app.route('/api/phones', methods=['GET'])
 def get_phones():
-    """API to get all phones as JSON"""
-    phones = data_manager.get_all_phones()
+    """
+    API to get phones as JSON
+    Without parameters the whole dataset is streamed as one JSON object.
+    ?limit=N&cursor=<phone> returns a single page plus the next cursor, and
+    ?format=ndjson streams one phone per line. Responses carry an ETag based on
+    the dataset version and the query, so unchanged polls get a 304 without
+    any serialization.
+    ?tenant=<chat id> selects the dataset (default: DEFAULT_TENANT_ID).
+    """
+    tenant_id = _request_tenant_id()
+    limit = request.args.get('limit', default=None, type=int)
+    cursor = request.args.get('cursor') or None
+    output_format = request.args.get('format', 'json')
+    if cursor is not None:
+        cursor = canonical_phone_key(cursor)
+        if cursor is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    if limit is not None:
+        limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+    if limit is not None or output_format != 'ndjson':
+        # Pages are always JSON
+        output_format = 'json'
     
-    # Convert datetime objects to strings for JSON serialization
-    serializable_data = {}
-    for phone, phone_data in phones.items():
-        serializable_data[phone] = phone_data.copy()
-        if isinstance(phone_data.get('renewal_date'), datetime):
-            serializable_data[phone]['renewal_date'] = format_date(phone_data['renewal_date'])
-        
-        serializable_data[phone]['accounts'] = []
-        for account in phone_data.get('accounts', []):
-            account_copy = account.copy()
-            if isinstance(account.get('renewal_date'), datetime):
-                account_copy['renewal_date'] = format_date(account['renewal_date'])
-            serializable_data[phone]['accounts'].append(account_copy)
+    # Every page and format is a different representation of the same version
+    query = hashlib.sha1(f"{limit}|{cursor}|{output_format}".encode()).hexdigest()[:16]
+    etag = f"phones-{tenant_id}-v{data_manager.get_version()}-{query}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    if limit is not None:
+        phones, _, has_next = data_manager.get_phones_page(
+            after=cursor, limit=limit, with_accounts=True, tenant_id=tenant_id
+        )
+        body = {
+            'phones': {phone['phone_number']: _serialize_phone(phone) for phone in phones},
+            'next_cursor': phones[-1]['phone_number'] if has_next else None
+        }
+        response = jsonify(body)
+        response.set_etag(etag)
+        return response
+    
+    phones = data_manager.iter_phones(with_accounts=True, after=cursor, tenant_id=tenant_id)
+    
+    if output_format == 'ndjson':
+        def generate():
+            for phone in phones:
+                yield json.dumps({'phone_number': phone['phone_number'], **_serialize_phone(phone)}, ensure_ascii=False) + '\n'
+        mimetype = 'application/x-ndjson'
+    else:
+        def generate():
+            yield '{'
+            separator = ''
+            for phone in phones:
+                yield f"{separator}{json.dumps(phone['phone_number'])}: {json.dumps(_serialize_phone(phone), ensure_ascii=False)}"
+                separator = ', '
+            yield '}'
+        mimetype = 'application/json'
     
-    return jsonify(serializable_data)
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/import', methods=['POST'])
+def import_phones():
+    """
+    API to bulk import phones and accounts
+    Accepts a multipart upload in the 'file' field (CSV or .xlsx) or a raw
+    text/csv request body, which is parsed from a temporary file once it has
+    been received in full
+    ?tenant=<chat id> selects the dataset to import into
+    """
+    tenant_id = _request_tenant_id()
+    upload = request.files.get('file')
+    source, filename = (upload.stream, upload.filename or '') if upload is not None else (request.stream, '')
+    # Receive the whole upload before import_rows opens its write transaction,
+    # so a slow client never holds the database write lock
+    with tempfile.TemporaryFile() as file:
+        shutil.copyfileobj(source, file)
+        file.seek(0)
+        try:
+            rows = read_rows(file, filename)
+            result = import_rows(data_manager, rows, tenant_id=tenant_id)
+        except (ValueError, UnicodeDecodeError) as e:
+            return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result.as_dict())
+
+@app.route('/api/export', methods=['GET'])
+def export_phones():
+    """
+    API to export all phones and accounts
+    ?format=csv (default) or ?format=ndjson; the file is streamed row by row
+    ?tenant=<chat id> selects the dataset to export
+    """
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported export format: {export_format}'}), 400
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = Response(
+        stream_with_context(iter_export(data_manager, export_format, _request_tenant_id())),
+        mimetype=mimetype
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=danhsach.{extension}'
+    return response
+
+@app.route('/api/search', methods=['GET'])
+def search_phones():
+    """
+    API to search phones and accounts as JSON
+    ?q=<part of a number or account name>, ?limit=N (at most SEARCH_MAX_RESULTS),
+    ?tenant=<chat id> selects the dataset
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query parameter q'}), 400
+    limit = max(1, min(request.args.get('limit', default=SEARCH_RESULT_LIMIT, type=int), SEARCH_MAX_RESULTS))
+    
+    results = data_manager.search(query, limit=limit, tenant_id=_request_tenant_id())
+    for result in results:
+        result['renewal_date'] = format_date(result['renewal_date'])
+    return jsonify({'query': query, 'results': results})
 
 @app.route('/api/upcoming_renewals', methods=['GET'])
 def get_upcoming_renewals():
-    """API to get upcoming renewals as JSON"""
-    days_before = request.args.get('days', default=1, type=int)
-    renewals = data_manager.get_upcoming_renewals(days_before=days_before)
+    """
+    API to get upcoming renewals as JSON
+    Accepts ?days=N for a single day, ?days=N&until=M for a window of days
+    from today, or ?from=DD/MM/YYYY&to=DD/MM/YYYY for an explicit date range
+    ?tenant=<chat id> selects the dataset
+    """
+    tenant_id = _request_tenant_id()
+    start_str = request.args.get('from')
+    end_str = request.args.get('to')
+    
+    if start_str or end_str:
+        try:
+            start_date = parse_date(start_str or end_str)
+            end_date = parse_date(end_str or start_str)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        renewals = data_manager.get_renewals_between(start_date, end_date, tenant_id=tenant_id)
+    else:
+        days_before = request.args.get('days', default=1, type=int)
+        days_until = request.args.get('until', default=None, type=int)
+        renewals = data_manager.get_upcoming_renewals(
+            days_before=days_before, days_until=days_until, tenant_id=tenant_id
+        )
     
     # Convert datetime objects to strings for JSON serialization
     for renewal in renewals:
@@ -588,6 +1120,11 @@ def get_upcoming_renewals():
     
     return jsonify(renewals)
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Handler, web and storage latency/counters in Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 # Main function for running the Telegram bot
 if __name__ == "__main__":
     # When this file is run directly, start the bot
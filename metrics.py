@@ -0,0 +1,219 @@
+"""
+In-process metrics: counters and latency histograms in Prometheus text format
+
+Bot handlers, Flask routes and DataManager methods are timed through the
+decorators below; GET /metrics renders everything recorded by this process.
+Recording an observation is a perf_counter() pair, a bisect and a short
+locked update, so it is cheap enough to leave on in the hot paths.
+Values live in process memory: with several uvicorn workers each scrape
+reports the worker that answered it.
+"""
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+# Default latency buckets in seconds; storage calls get finer ones
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STORAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+def _escape(value):
+    """Escape a label value for the text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=()):
+    """Render {name="value",...} for one series"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(labelnames, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    """Render a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """A monotonically increasing count per label set"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        """Add `amount` to the series identified by the label values"""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        """Current value of a series (0 if never incremented)"""
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        """Yield (suffix, label string, value) for every series"""
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in sorted(values):
+            yield "_total", _format_labels(self.labelnames, labels), value
+
+class Histogram:
+    """Cumulative latency buckets plus sum and count per label set"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        """Record one observation for the series identified by the label values"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        """Number of observations recorded for a series"""
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        """Yield (suffix, label string, value) for every bucket, sum and count"""
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot, key=lambda series: series[0]):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield "_bucket", _format_labels(self.labelnames, labels, [('le', _format_value(bound))]), cumulative
+            yield "_sum", _format_labels(self.labelnames, labels), total
+            yield "_count", _format_labels(self.labelnames, labels), count
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        """Create and register a Counter"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a Histogram"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HANDLER_LATENCY = REGISTRY.histogram(
+    'bot_handler_duration_seconds', 'Time spent handling a Telegram update', ('handler',)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    'bot_handler_errors', 'Telegram update handlers that raised', ('handler',)
+)
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time until a web response is ready (streamed bodies excluded)',
+    ('method', 'endpoint')
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests', 'Web requests served', ('method', 'endpoint', 'status')
+)
+STORAGE_LATENCY = REGISTRY.histogram(
+    'storage_operation_duration_seconds', 'Time spent in DataManager operations', ('operation',),
+    buckets=STORAGE_BUCKETS
+)
+STORAGE_ERRORS = REGISTRY.counter(
+    'storage_operation_errors', 'DataManager operations that raised', ('operation',)
+)
+RENDER_CACHE_EVENTS = REGISTRY.counter(
+    'render_cache_events', 'Render cache hits, misses and evictions', ('cache', 'event')
+)
+
+def timed(histogram, errors=None, name=None):
+    """
+    Decorator recording the duration of each call in `histogram`
+    The series is labelled with `name` (default: the function's name); calls
+    that raise are also counted in `errors`. Works for sync and async functions.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    if errors is not None:
+                        errors.inc(label)
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - started, label)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(label)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, label)
+        return wrapper
+    return decorator
+
+# Decorators for the three instrumented layers
+timed_handler = timed(HANDLER_LATENCY, HANDLER_ERRORS)
+timed_storage = timed(STORAGE_LATENCY, STORAGE_ERRORS)
+
+def instrument_flask(app):
+    """Record latency and status of every request served by a Flask app"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            HTTP_LATENCY.observe(time.perf_counter() - started, request.method, endpoint)
+            HTTP_REQUESTS.inc(request.method, endpoint, response.status_code)
+        return response
+
+    return app
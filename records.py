@@ -0,0 +1,101 @@
+"""
+Compact in-memory records for phones and accounts
+
+Dates are kept as proleptic ordinals (ints) and account names are interned,
+so the many repeated names ("Facebook", "Zalo", ...) share one string object.
+Records use __slots__ instead of a per-object __dict__, and expose a read-only
+dict-like view ('renewal_date', 'accounts', 'name', ...) so main.py and the
+templates keep working with record['renewal_date'] or record.get('accounts').
+"""
+import sys
+from datetime import datetime
+
+def to_ordinal(date_obj):
+    """Convert a date/datetime to its proleptic Gregorian ordinal"""
+    return date_obj.toordinal()
+
+def from_ordinal(ordinal):
+    """Convert an ordinal back to a datetime at midnight"""
+    return datetime.fromordinal(ordinal)
+
+class _RecordView:
+    """Read-only mapping interface shared by the record classes"""
+    __slots__ = ()
+    _keys = ()
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if the key is unknown"""
+        if key not in self._keys:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self._keys]
+
+    def copy(self):
+        """Return a plain dict copy of the record"""
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, _RecordView)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+class AccountRecord(_RecordView):
+    """An account linked to a phone number"""
+    __slots__ = ('_name', 'renewal_ordinal')
+    _keys = ('name', 'renewal_date')
+
+    def __init__(self, name, renewal_ordinal):
+        self._name = sys.intern(name)
+        self.renewal_ordinal = renewal_ordinal
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def renewal_date(self):
+        return from_ordinal(self.renewal_ordinal)
+
+class PhoneRecord(_RecordView):
+    """A phone number with its renewal date and accounts"""
+    __slots__ = ('phone_number', 'renewal_ordinal', '_accounts')
+    _keys = ('renewal_date', 'accounts')
+
+    def __init__(self, phone_number, renewal_ordinal, accounts=()):
+        self.phone_number = phone_number
+        self.renewal_ordinal = renewal_ordinal
+        self._accounts = tuple(accounts)
+
+    @property
+    def renewal_date(self):
+        return from_ordinal(self.renewal_ordinal)
+
+    @property
+    def accounts(self):
+        return list(self._accounts)
+
+    def add_account(self, account):
+        """Append an account (used while loading from storage)"""
+        self._accounts += (account,)
@@ -0,0 +1,88 @@
+"""
+Priority queue of pending reminders for event-driven scheduling
+
+Each reminder is keyed by (item_key, offset) and ordered by the time it is due.
+Rescheduling or cancelling a reminder does not search the heap: the old heap
+entry is simply left behind and skipped when it reaches the top, so every
+operation is O(log n).
+"""
+import heapq
+import itertools
+from collections import defaultdict
+
+class ReminderQueue:
+    """Min-heap of reminders ordered by due time, with lazy invalidation"""
+
+    def __init__(self):
+        self._heap = []
+        # key -> (sequence, due_at, renewal); a heap entry is live only while
+        # its sequence number matches the one stored here
+        self._entries = {}
+        self._by_phone = defaultdict(set)
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, due_at, renewal):
+        """Add a reminder, or move it if it is already queued for another time"""
+        current = self._entries.get(key)
+        if current is not None and current[1] == due_at and current[2] == renewal:
+            return
+        sequence = next(self._sequence)
+        self._entries[key] = (sequence, due_at, renewal)
+        self._by_phone[renewal['tenant_id'], renewal['phone_number']].add(key)
+        heapq.heappush(self._heap, (due_at, sequence, key))
+
+    def cancel(self, key):
+        """Drop a queued reminder; unknown keys are ignored"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        phone = entry[2]['tenant_id'], entry[2]['phone_number']
+        keys = self._by_phone[phone]
+        keys.discard(key)
+        if not keys:
+            del self._by_phone[phone]
+
+    def cancel_phone(self, tenant_id, phone_number):
+        """Drop every reminder of a tenant's phone number and of its accounts"""
+        for key in self._by_phone.pop((tenant_id, phone_number), ()):
+            self._entries.pop(key, None)
+
+    def keys(self):
+        """Keys of every queued reminder"""
+        return set(self._entries)
+
+    def keys_for_phone(self, tenant_id, phone_number):
+        """Keys of the reminders queued for a tenant's phone number and its accounts"""
+        return set(self._by_phone.get((tenant_id, phone_number), ()))
+
+    def _discard_stale(self):
+        """Pop heap entries that were rescheduled or cancelled"""
+        while self._heap:
+            _, sequence, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sequence:
+                return
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        """Due time of the earliest reminder, or None if the queue is empty"""
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return (key, renewal) for every reminder due at or before now"""
+        due = []
+        while True:
+            self._discard_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            _, _, key = heapq.heappop(self._heap)
+            renewal = self._entries[key][2]
+            self.cancel(key)
+            due.append((key, renewal))
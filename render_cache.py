@@ -0,0 +1,81 @@
+"""
+Read-through cache for rendered web pages and bot list replies
+
+Every entry remembers the dataset version (DataManager.get_version) it was
+rendered from. The version is bumped by a trigger on every change to phones or
+accounts, so a lookup only has to compare it with the current version: mutations
+never touch the cache, and stale entries are re-rendered on their next use.
+"""
+import threading
+from collections import OrderedDict
+
+from config import RENDER_CACHE_SIZE
+from metrics import RENDER_CACHE_EVENTS
+
+MISSING = object()
+
+class RenderCache:
+    """
+    Bounded LRU mapping key -> (version, rendered value)
+    Safe to share between Flask worker threads and the bot's event loop.
+    """
+
+    def __init__(self, name, maxsize=RENDER_CACHE_SIZE):
+        self.name = name
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hits(self):
+        """Number of lookups served from the cache"""
+        return RENDER_CACHE_EVENTS.value(self.name, 'hit')
+
+    @property
+    def misses(self):
+        """Number of lookups that had to render"""
+        return RENDER_CACHE_EVENTS.value(self.name, 'miss')
+
+    def get(self, key, version):
+        """Return the value rendered for `key` at `version`, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                RENDER_CACHE_EVENTS.inc(self.name, 'hit')
+                return entry[1]
+        RENDER_CACHE_EVENTS.inc(self.name, 'miss')
+        return MISSING
+
+    def put(self, key, version, value):
+        """
+        Store a value rendered from `version`
+        Callers must read the version before loading the data they render, so a
+        write that lands in between leaves an entry that is already stale.
+        """
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                RENDER_CACHE_EVENTS.inc(self.name, 'eviction')
+
+    def get_or_render(self, key, version, render):
+        """
+        Return the cached value for `key` at `version`, calling render() on a miss
+        A render() result of None is passed through without being cached.
+        """
+        value = self.get(key, version)
+        if value is MISSING:
+            value = render()
+            if value is not None:
+                self.put(key, version, value)
+        return value
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
@@ -1,114 +1,452 @@
 """
 Scheduler module for managing renewal reminders
 """
+import asyncio
 import logging
-from datetime import datetime, time
+from collections import deque
+from datetime import datetime, time, timedelta
 
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from telegram import Bot
 
-from config import ADMIN_CHAT_ID, REMINDER_DAYS_BEFORE
+from config import (
+    REMINDER_OFFSETS,
+    OVERDUE_FOLLOWUP_DAYS,
+    REMINDER_HOUR,
+    REMINDER_MODE,
+    REMINDER_HORIZON_DAYS,
+    REMINDER_DIGEST_MODE,
+    MAX_MESSAGE_LENGTH,
+    CHECKPOINT_INTERVAL_MINUTES,
+    SNAPSHOT_PATH,
+    SNAPSHOT_HOUR,
+    LEDGER_RETENTION_DAYS,
+)
 from data_manager import DataManager
-from utils import format_reminder_message
+from dispatcher import OutgoingMessage, ReminderDispatcher
+from reminder_queue import ReminderQueue
+from utils import due_reminder_offsets, format_reminder_message, format_digest_messages
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on a single timer sleep, so wall-clock jumps (NTP, suspend) are
+# noticed within a few minutes
+MAX_TIMER_SLEEP_SECONDS = 300
+
+def _round_robin(iterables):
+    """Interleave several iterables, taking one item from each in turn"""
+    iterators = deque(iter(iterable) for iterable in iterables)
+    while iterators:
+        iterator = iterators.popleft()
+        try:
+            yield next(iterator)
+        except StopIteration:
+            continue
+        iterators.append(iterator)
+
 class ReminderScheduler:
     """
     Handles scheduling and sending of renewal reminders
+    Jobs run as coroutines on the bot's own event loop, so they share the
+    Application's HTTP connection pool instead of spinning up a loop per run.
+    Each tenant's reminders go to the tenant's own chat.
     """
     
-    def __init__(self, bot: Bot, data_manager: DataManager):
-        """Initialize the scheduler with bot and data manager"""
+    def __init__(self, bot: Bot, data_manager: DataManager, digest_mode=REMINDER_DIGEST_MODE, mode=REMINDER_MODE):
+        """
+        Initialize the scheduler with bot and data manager
+        In digest mode the day's reminders are packed into a few long messages,
+        otherwise one message is sent per phone or account.
+        `mode` is "daily" (one scan a day) or "event" (one timer per reminder)
+        """
         self.bot = bot
         self.data_manager = data_manager
-        self.scheduler = BackgroundScheduler()
-        self.chat_id = ADMIN_CHAT_ID
+        self.scheduler = AsyncIOScheduler()
+        self.digest_mode = digest_mode
+        self.mode = mode
+        self.dispatcher = ReminderDispatcher(bot)
+        self.last_dispatch_metrics = None
+        self.queue = ReminderQueue()
+        self._loop = None
+        self._wakeup = None
+        self._timer_task = None
+        # Dataset version the queue was last loaded from (event mode)
+        self._storage_version = None
+        # One delivery run at a time: a run reads the ledger before sending, so
+        # overlapping runs (startup check, cron job, manual check, timers) would
+        # otherwise send the same reminders twice
+        self._send_lock = asyncio.Lock()
     
     def start(self):
-        """Start the scheduler"""
-        # Schedule daily check at 8:00 AM
+        """
+        Start the scheduler
+        Must be called while the bot's event loop is running (e.g. from post_init)
+        """
+        if self.mode == 'event':
+            self._start_event_mode()
+        else:
+            # Schedule daily check at REMINDER_HOUR (8:00 AM by default)
+            self.scheduler.add_job(
+                self.check_renewals,
+                CronTrigger(hour=REMINDER_HOUR, minute=0),
+                name='daily_renewal_check'
+            )
+            
+            # Add a job that runs immediately after starting
+            self.scheduler.add_job(
+                self.check_renewals,
+                name='initial_renewal_check'
+            )
+        
+        # Storage maintenance: keep the write-ahead log short and refresh the snapshot
         self.scheduler.add_job(
-            self._run_check_renewals_wrapper,
-            CronTrigger(hour=8, minute=0),
-            name='daily_renewal_check'
+            self.checkpoint_storage,
+            IntervalTrigger(minutes=CHECKPOINT_INTERVAL_MINUTES),
+            name='storage_checkpoint'
         )
+        if SNAPSHOT_PATH:
+            self.scheduler.add_job(
+                self.snapshot_storage,
+                CronTrigger(hour=SNAPSHOT_HOUR, minute=0),
+                name='storage_snapshot'
+            )
         
-        # Add a job that runs immediately after starting
         self.scheduler.add_job(
-            self._run_check_renewals_wrapper,
-            name='initial_renewal_check'
+            self.prune_ledger,
+            CronTrigger(hour=0, minute=30),
+            name='reminder_ledger_prune'
         )
         
         self.scheduler.start()
         logger.info("Reminder scheduler started")
         
-    def _run_check_renewals_wrapper(self):
+    def stop(self):
+        """Stop the scheduler"""
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self._timer_task is not None:
+            self.data_manager.remove_listener(self._on_storage_change)
+            self._timer_task.cancel()
+            self._timer_task = None
+        logger.info("Reminder scheduler stopped")
+    
+    # Event mode
+    # Instead of scanning every day, each reminder due within the next
+    # REMINDER_HORIZON_DAYS gets a timer in a priority queue. The queue is
+    # loaded with one indexed date-range query, kept current by DataManager
+    # change notifications, and topped up once a day as the horizon moves.
+    # Notifications only cover writes made through this process's DataManager;
+    # writes from other processes (Gunicorn web workers, other uvicorn workers)
+    # are picked up by comparing the dataset version before every send and at
+    # least every MAX_TIMER_SLEEP_SECONDS, reloading the queue when it moved.
+    def _start_event_mode(self):
+        """Register for storage changes and start the timer task"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.data_manager.add_listener(self._on_storage_change)
+        self._timer_task = asyncio.create_task(self._run_timers())
+        
+        # Load the horizon now, then extend it by a day every night
+        self.scheduler.add_job(
+            self.load_reminder_horizon,
+            name='initial_reminder_load'
+        )
+        self.scheduler.add_job(
+            self.load_reminder_horizon,
+            CronTrigger(hour=0, minute=5),
+            name='reminder_horizon_refill'
+        )
+    
+    @staticmethod
+    def _today():
+        """Midnight of the current day"""
+        return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    @staticmethod
+    def _due_at(due_date):
+        """When a reminder due on due_date should be sent"""
+        return datetime.combine(due_date.date(), time(hour=REMINDER_HOUR))
+    
+    def _schedule_reminder(self, reminder):
         """
-        Non-async wrapper for check_renewals to be used with scheduler
-        Creates and runs a new event loop for the async function
+        Queue (or move) one reminder returned by get_due_reminders
+        Reminders due earlier today fire at once, so a renewal added after
+        REMINDER_HOUR for tomorrow is still reminded today
         """
-        import asyncio
+        item_key, _, offset = self._ledger_entry(reminder)
+        self.queue.schedule((item_key, offset), self._due_at(reminder['due_date']), reminder)
+    
+    async def load_reminder_horizon(self):
+        """
+        Queue every undelivered reminder due between today and
+        REMINDER_HORIZON_DAYS ahead, and drop queued reminders storage no
+        longer returns (deleted or re-dated items)
+        """
+        today = self._today()
+        try:
+            version = await asyncio.to_thread(self.data_manager.get_version)
+            reminders = await asyncio.to_thread(
+                self.data_manager.get_due_reminders,
+                today, today + timedelta(days=REMINDER_HORIZON_DAYS)
+            )
+            delivered = set()
+            if reminders:
+                delivered = await asyncio.to_thread(
+                    self.data_manager.get_delivered_reminders,
+                    min(reminder['renewal_date'] for reminder in reminders),
+                    max(reminder['renewal_date'] for reminder in reminders)
+                )
+        except Exception as e:
+            logger.error("Error loading upcoming reminders: %s", e)
+            return
+        
+        stale = self.queue.keys()
+        for reminder in reminders:
+            item_key, renewal_ordinal, offset = self._ledger_entry(reminder)
+            if (item_key, renewal_ordinal, offset) in delivered:
+                continue
+            self._schedule_reminder(reminder)
+            stale.discard((item_key, offset))
+        for key in stale:
+            self.queue.cancel(key)
+        self._storage_version = version
+        self._wakeup.set()
+        logger.info("Reminder queue holds %d reminders", len(self.queue))
+    
+    async def _sync_with_storage(self):
+        """Reload the queue if the dataset changed since it was last loaded"""
+        try:
+            version = await asyncio.to_thread(self.data_manager.get_version)
+        except Exception as e:
+            logger.error("Error reading the dataset version: %s", e)
+            return
+        if version != self._storage_version:
+            await self.load_reminder_horizon()
+    
+    def _on_storage_change(self, tenant_id, phone_number, account_name, renewal_date, reminder_offsets,
+                           versions=None):
+        """DataManager listener; runs on the committing thread, so hop to the loop"""
+        try:
+            self._loop.call_soon_threadsafe(
+                self._apply_change, tenant_id, phone_number, account_name, renewal_date, reminder_offsets,
+                versions
+            )
+        except RuntimeError:
+            # Event loop already closed during shutdown
+            pass
+    
+    def _apply_change(self, tenant_id, phone_number, account_name, renewal_date, reminder_offsets,
+                      versions=None):
+        """Replace the queued reminders of a phone or account after it changed"""
+        if versions is not None and versions[0] == self._storage_version:
+            # A write of this process, applied below: _sync_with_storage only
+            # needs to reload for versions written by other processes
+            self._storage_version = versions[1]
+        
+        if account_name is None and renewal_date is None:
+            self.queue.cancel_phone(tenant_id, phone_number)
+            self._wakeup.set()
+            return
         
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        renewal = {
+            'tenant_id': tenant_id,
+            'type': 'phone',
+            'phone_number': phone_number,
+            'renewal_date': renewal_date
+        }
+        if account_name is not None:
+            renewal['type'] = 'account'
+            renewal['account_name'] = account_name
+        item_key = self._item_key(renewal)
+        for key in self.queue.keys_for_phone(tenant_id, phone_number):
+            if key[0] == item_key:
+                self.queue.cancel(key)
         
+        if renewal_date is not None:
+            today = self._today().toordinal()
+            due_reminders = due_reminder_offsets(
+                renewal_date.toordinal(),
+                reminder_offsets or REMINDER_OFFSETS,
+                OVERDUE_FOLLOWUP_DAYS,
+                today,
+                today + REMINDER_HORIZON_DAYS
+            )
+            for offset, due in due_reminders:
+                self._schedule_reminder(dict(renewal, offset=offset, due_date=datetime.fromordinal(due)))
+        self._wakeup.set()
+    
+    async def _run_timers(self):
+        """Sleep until the earliest queued reminder is due, then send everything due"""
+        while True:
+            next_due = self.queue.next_due()
+            timeout = MAX_TIMER_SLEEP_SECONDS
+            if next_due is not None:
+                timeout = min(timeout, max(0.0, (next_due - datetime.now()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            # Catch up with writes made by other processes before sending
+            await self._sync_with_storage()
+            due = self.queue.pop_due(datetime.now())
+            if not due:
+                continue
+            try:
+                await self._send_reminders([renewal for _, renewal in due])
+            except Exception as e:
+                logger.error("Error sending %d due reminders: %s", len(due), e)
+    
+    async def checkpoint_storage(self):
+        """Checkpoint the database's write-ahead log off the event loop"""
         try:
-            loop.run_until_complete(self.check_renewals())
-        finally:
-            loop.close()
+            await asyncio.to_thread(self.data_manager.checkpoint)
+        except Exception as e:
+            logger.error("Error checkpointing database: %s", e)
     
-    def stop(self):
-        """Stop the scheduler"""
-        self.scheduler.shutdown()
-        logger.info("Reminder scheduler stopped")
+    async def snapshot_storage(self):
+        """Write a compacted database snapshot off the event loop"""
+        try:
+            await asyncio.to_thread(self.data_manager.snapshot)
+        except Exception as e:
+            logger.error("Error writing database snapshot: %s", e)
+    
+    async def prune_ledger(self):
+        """Forget delivery records of renewals older than LEDGER_RETENTION_DAYS"""
+        cutoff = datetime.now() - timedelta(days=LEDGER_RETENTION_DAYS)
+        try:
+            removed = await asyncio.to_thread(self.data_manager.prune_reminder_ledger, cutoff)
+            logger.info("Pruned %d reminder ledger entries", removed)
+        except Exception as e:
+            logger.error("Error pruning reminder ledger: %s", e)
+    
+    @staticmethod
+    def _item_key(renewal):
+        """Stable key of the phone or account a renewal belongs to, prefixed by its tenant"""
+        if renewal['type'] == 'account':
+            return f"{renewal['tenant_id']}:account:{renewal['phone_number']}:{renewal['account_name']}"
+        return f"{renewal['tenant_id']}:phone:{renewal['phone_number']}"
+    
+    @classmethod
+    def _ledger_entry(cls, renewal):
+        """Ledger key of a reminder: (item, renewal date ordinal, offset in days)"""
+        return cls._item_key(renewal), renewal['renewal_date'].toordinal(), renewal['offset']
+    
+    async def _record_delivery(self, message):
+        """Store the ledger entries of a message Telegram accepted"""
+        try:
+            await asyncio.to_thread(self.data_manager.record_delivered_reminders, message.payload)
+        except Exception as e:
+            logger.error("Error recording delivery of reminder %s: %s", message.label, e)
     
     async def check_renewals(self):
-        """Check for upcoming renewals and send reminders"""
+        """
+        Check for reminders due today and send them
+        Every configured offset and overdue follow-up is resolved by one query
+        """
         logger.info("Checking for upcoming renewals...")
-        upcoming_renewals = self.data_manager.get_upcoming_renewals(days_before=REMINDER_DAYS_BEFORE)
+        today = self._today()
+        upcoming_renewals = await asyncio.to_thread(self.data_manager.get_due_reminders, today, today)
         
         if not upcoming_renewals:
             logger.info("No upcoming renewals found")
             return
+        return await self._send_reminders(upcoming_renewals)
+    
+    async def _send_reminders(self, upcoming_renewals):
+        """Send the reminders of these renewals that were not delivered before"""
+        async with self._send_lock:
+            # Skip reminders that were already delivered (restart, manual check or
+            # a crashed run): one ledger query, then O(1) lookups per reminder
+            delivered = await asyncio.to_thread(
+                self.data_manager.get_delivered_reminders,
+                min(renewal['renewal_date'] for renewal in upcoming_renewals),
+                max(renewal['renewal_date'] for renewal in upcoming_renewals)
+            )
+            pending_renewals = [
+                renewal for renewal in upcoming_renewals
+                if self._ledger_entry(renewal) not in delivered
+            ]
+            
+            logger.info(
+                "Found %d due reminders, %d already reminded",
+                len(upcoming_renewals), len(upcoming_renewals) - len(pending_renewals)
+            )
+            if not pending_renewals:
+                return
+            
+            # Queue a reminder for each upcoming renewal and let the dispatcher send them
+            self.last_dispatch_metrics = await self.dispatcher.send_all(
+                self._build_messages(pending_renewals),
+                on_delivered=self._record_delivery
+            )
+            return self.last_dispatch_metrics
+    
+    def _build_messages(self, upcoming_renewals):
+        """
+        Turn upcoming renewals into outgoing reminder messages, one set per tenant
+        Tenants are interleaved, so the per-chat rate limit of one large tenant
+        does not hold up the reminders of every other tenant behind it
+        """
+        by_tenant = {}
+        for renewal in upcoming_renewals:
+            by_tenant.setdefault(renewal['tenant_id'], []).append(renewal)
+        return _round_robin(
+            self._build_tenant_messages(tenant_id, renewals)
+            for tenant_id, renewals in by_tenant.items()
+        )
+    
+    def _build_tenant_messages(self, tenant_id, upcoming_renewals):
+        """Turn one tenant's upcoming renewals into messages for the tenant's chat"""
+        if self.digest_mode:
+            digest = format_digest_messages(upcoming_renewals, max_length=MAX_MESSAGE_LENGTH, with_items=True)
+            for page, (message, items) in enumerate(digest, 1):
+                yield OutgoingMessage(
+                    chat_id=tenant_id,
+                    text=message,
+                    label=f"digest {page}/{len(digest)} for chat {tenant_id}",
+                    payload=[self._ledger_entry(item) for item in items]
+                )
+            return
         
-        logger.info(f"Found {len(upcoming_renewals)} upcoming renewals")
-        
-        # Send reminders for each upcoming renewal
         for renewal in upcoming_renewals:
-            try:
-                if renewal['type'] == 'phone':
-                    message = format_reminder_message(
-                        'phone', 
-                        renewal['phone_number'], 
-                        renewal['renewal_date']
-                    )
-                    await self.bot.send_message(
-                        chat_id=self.chat_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-                    logger.info(f"Sent reminder for phone {renewal['phone_number']}")
-                
-                elif renewal['type'] == 'account':
-                    message = format_reminder_message(
-                        'account',
-                        renewal['phone_number'],
-                        renewal['renewal_date'],
-                        renewal['account_name']
-                    )
-                    await self.bot.send_message(
-                        chat_id=self.chat_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-                    logger.info(f"Sent reminder for account {renewal['account_name']} of phone {renewal['phone_number']}")
+            if renewal['type'] == 'phone':
+                message = format_reminder_message(
+                    'phone', 
+                    renewal['phone_number'], 
+                    renewal['renewal_date'],
+                    offset=renewal['offset']
+                )
+                label = f"for phone {renewal['phone_number']} in chat {tenant_id}"
             
-            except Exception as e:
-                logger.error(f"Error sending reminder: {e}")
+            elif renewal['type'] == 'account':
+                message = format_reminder_message(
+                    'account',
+                    renewal['phone_number'],
+                    renewal['renewal_date'],
+                    renewal['account_name'],
+                    offset=renewal['offset']
+                )
+                label = (
+                    f"for account {renewal['account_name']} of phone {renewal['phone_number']} "
+                    f"in chat {tenant_id}"
+                )
+            
+            else:
+                continue
+            
+            yield OutgoingMessage(
+                chat_id=tenant_id,
+                text=message,
+                label=label,
+                payload=[self._ledger_entry(renewal)]
+            )
     
     async def run_manual_check(self):
         """Manually trigger a check for renewals"""
-        await self.check_renewals()
+        metrics = await self.check_renewals()
         logger.info("Manual renewal check triggered")
+        return metrics
@@ -0,0 +1,55 @@
+"""
+Replay recorded Telegram Update JSON against a local webhook
+
+Usage:
+    python scripts/post_update.py scripts/sample_update.json [more.json ...]
+        [--url http://127.0.0.1:8443/telegram/webhook] [--secret TOKEN]
+
+Each file holds one Update object or a list of them. Works against both the
+BOT_RUN_MODE=webhook server and the unified server in server.py. Updates
+without an update_id get increasing ids so they are not dropped as duplicates.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET_TOKEN
+
+def post_update(url, update, secret_token=None):
+    """POST one update and return the HTTP status code"""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    if secret_token:
+        request.add_header('X-Telegram-Bot-Api-Secret-Token', secret_token)
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+', help='JSON files with recorded updates')
+    parser.add_argument('--url', default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument('--secret', default=WEBHOOK_SECRET_TOKEN)
+    args = parser.parse_args()
+
+    update_ids = itertools.count(1)
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            updates = json.load(f)
+        if isinstance(updates, dict):
+            updates = [updates]
+        for update in updates:
+            update.setdefault('update_id', next(update_ids))
+            status = post_update(args.url, update, args.secret)
+            print(f"{path}: update {update['update_id']} -> HTTP {status}")
+
+if __name__ == '__main__':
+    main()
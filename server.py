@@ -0,0 +1,153 @@
+"""
+Unified runtime - serves the Telegram bot (via webhook) and the Flask web app
+from a single ASGI server process, sharing one DataManager
+
+Run with:
+    uvicorn server:asgi_app --host 0.0.0.0 --port 8000 [--workers N]
+
+Telegram updates are POSTed to WEBHOOK_PATH and fed into the bot's update
+queue; every other request is handed to the Flask app. With several workers
+all of them process updates against the same SQLite database (WAL mode lets
+readers and one writer work concurrently, and the dataset version counter
+tells each worker when another one changed the data). Only one worker,
+the one holding the scheduler lock file, runs the reminder scheduler.
+"""
+import hmac
+import json
+import logging
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from telegram import Update
+
+from config import DATABASE_PATH, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN
+from main import app, build_application, post_init, post_shutdown
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class UnifiedApp:
+    """
+    ASGI application routing webhook updates to the bot and the rest to Flask
+    """
+
+    def __init__(self, application, flask_app):
+        self.application = application
+        self.flask = WsgiToAsgi(flask_app)
+        self._scheduler_lock = None
+
+    def _acquire_scheduler_lock(self):
+        """
+        Try to become the worker that runs the reminder scheduler
+        Returns True if this process holds the lock
+        """
+        if fcntl is None:
+            return True
+        lock_file = open(f"{DATABASE_PATH}.scheduler.lock", 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._scheduler_lock = lock_file
+        return True
+
+    async def startup(self):
+        """Initialize the bot, start update processing and register the webhook"""
+        await self.application.initialize()
+        if self._acquire_scheduler_lock():
+            logger.info("Worker %d runs the reminder scheduler", os.getpid())
+            await post_init(self.application)
+        await self.application.start()
+
+        if WEBHOOK_URL:
+            await self.application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info("Webhook registered at %s", WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH)
+        else:
+            logger.warning(
+                "WEBHOOK_URL is not set: updates posted to %s are only accepted if the "
+                "webhook was registered with WEBHOOK_SECRET_TOKEN", WEBHOOK_PATH
+            )
+
+    async def shutdown(self):
+        """Stop update processing and release resources"""
+        await self.application.stop()
+        await post_shutdown(self.application)
+        await self.application.shutdown()
+        if self._scheduler_lock is not None:
+            self._scheduler_lock.close()
+            self._scheduler_lock = None
+
+    async def _lifespan(self, receive, send):
+        """Handle the ASGI lifespan protocol"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    logger.exception("Startup failed")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _respond(self, send, status, body=b''):
+        """Send a minimal plain-text response"""
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain; charset=utf-8')]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _handle_update(self, scope, receive, send):
+        """Parse a webhook request and put the update on the bot's queue"""
+        # Anyone can POST to the public port: only Telegram knows the secret
+        headers = dict(scope['headers'])
+        token = headers.get(b'x-telegram-bot-api-secret-token', b'')
+        if not hmac.compare_digest(token, WEBHOOK_SECRET_TOKEN.encode()):
+            await self._respond(send, 403, b'Forbidden')
+            return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            await self._respond(send, 400, b'Invalid update')
+            return
+
+        await self.application.update_queue.put(update)
+        await self._respond(send, 200, b'OK')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == WEBHOOK_PATH and scope['method'] == 'POST':
+            await self._handle_update(scope, receive, send)
+        else:
+            await self.flask(scope, receive, send)
+
+asgi_app = UnifiedApp(build_application(), app)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("server:asgi_app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")))
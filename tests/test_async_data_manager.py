@@ -0,0 +1,56 @@
+"""
+Write coalescing tests: writes batched into one transaction still succeed or
+fail one by one
+
+Usage: python -m pytest -q tests  (or python -m unittest discover tests)
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from async_data_manager import AsyncDataManager
+from data_manager import DataManager
+
+class CoalescedWriteTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_manager = DataManager(os.path.join(tmp.name, 'async.db'), snapshot_path=None)
+
+    def test_failed_write_leaves_nothing_behind(self):
+        notified = []
+        self.data_manager.add_listener(lambda *change: notified.append(change[1]))
+
+        def add_then_fail():
+            # Writes a row, then fails like an operation with a late check would
+            self.data_manager.add_phone('0387654321', datetime(2026, 6, 2))
+            raise ValueError("late failure")
+        self.data_manager.add_then_fail = add_then_fail
+
+        async def run():
+            async_data_manager = AsyncDataManager(self.data_manager, max_workers=1, coalesce_delay=0.01)
+            try:
+                return await asyncio.gather(
+                    async_data_manager.add_phone('0912345678', datetime(2026, 6, 1)),
+                    async_data_manager._write('add_then_fail'),
+                    async_data_manager.add_phone('0987654321', datetime(2026, 6, 3)),
+                    return_exceptions=True
+                )
+            finally:
+                async_data_manager.close()
+
+        first, failed, last = asyncio.run(run())
+        self.assertIs(first, True)
+        self.assertIsInstance(failed, ValueError)
+        self.assertIs(last, True)
+        self.assertEqual(sorted(self.data_manager.get_all_phones()), ['0912345678', '0987654321'])
+        self.assertEqual(sorted(notified), ['0912345678', '0987654321'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+"""
+Migration tests: databases written by every older schema version open with the
+current DataManager, with the spellings of one number merged into one record
+
+Usage: python -m pytest -q tests  (or python -m unittest discover tests)
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DEFAULT_TENANT_ID
+from data_manager import SCHEMA_VERSION, DataManager
+from utils import national_number
+
+TENANT = DEFAULT_TENANT_ID
+
+# Table definitions of each older schema, as the releases that used them wrote them
+OLD_SCHEMAS = {
+    0: """
+        CREATE TABLE phones (phone_number TEXT PRIMARY KEY, renewal_date TEXT NOT NULL);
+        CREATE TABLE accounts (
+            phone_number TEXT NOT NULL REFERENCES phones (phone_number) ON DELETE CASCADE,
+            account_name TEXT NOT NULL, renewal_date TEXT NOT NULL,
+            PRIMARY KEY (phone_number, account_name)
+        );
+    """,
+    1: """
+        CREATE TABLE phones (phone_number TEXT PRIMARY KEY, renewal_date INTEGER NOT NULL);
+        CREATE TABLE accounts (
+            phone_number TEXT NOT NULL REFERENCES phones (phone_number) ON DELETE CASCADE,
+            account_name TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            PRIMARY KEY (phone_number, account_name)
+        );
+        CREATE TABLE reminder_schedules (
+            phone_number TEXT NOT NULL REFERENCES phones (phone_number) ON DELETE CASCADE,
+            account_name TEXT NOT NULL DEFAULT '', offsets TEXT NOT NULL,
+            PRIMARY KEY (phone_number, account_name)
+        ) WITHOUT ROWID;
+    """,
+    2: """
+        CREATE TABLE phones (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number)
+        );
+        CREATE TABLE accounts (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name)
+        );
+        CREATE TABLE reminder_schedules (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL DEFAULT '', offsets TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name)
+        ) WITHOUT ROWID;
+    """,
+    3: """
+        CREATE TABLE phones (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+            national_number TEXT NOT NULL, reversed_number TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number)
+        );
+        CREATE TABLE accounts (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL, renewal_date INTEGER NOT NULL, name_key TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name)
+        );
+        CREATE TABLE reminder_schedules (
+            tenant_id INTEGER NOT NULL, phone_number TEXT NOT NULL,
+            account_name TEXT NOT NULL DEFAULT '', offsets TEXT NOT NULL,
+            PRIMARY KEY (tenant_id, phone_number, account_name)
+        ) WITHOUT ROWID;
+        CREATE TABLE account_names (
+            tenant_id INTEGER NOT NULL, name_key TEXT NOT NULL, account_count INTEGER NOT NULL,
+            PRIMARY KEY (tenant_id, name_key)
+        ) WITHOUT ROWID;
+    """,
+}
+
+# The reminder ledger arrived in version 1 and has kept its layout since
+LEDGER = """
+    CREATE TABLE reminder_ledger (
+        item_key TEXT NOT NULL, renewal_date INTEGER NOT NULL,
+        reminder_offset INTEGER NOT NULL, sent_at TEXT NOT NULL,
+        PRIMARY KEY (item_key, renewal_date, reminder_offset)
+    ) WITHOUT ROWID;
+"""
+
+# Two spellings of one number, each with its own date and accounts, plus an
+# unrelated number whose account name only differs in case
+PHONES = [
+    ('0912345678', datetime(2026, 3, 1)),
+    ('+84912345678', datetime(2026, 4, 1)),
+    ('0387654321', datetime(2026, 5, 1)),
+]
+ACCOUNTS = [
+    ('0912345678', 'Zalo', datetime(2026, 3, 5)),
+    ('0912345678', 'Gmail', datetime(2026, 3, 10)),
+    ('+84912345678', 'Zalo', datetime(2026, 4, 5)),
+    ('+84912345678', 'Facebook', datetime(2026, 4, 2)),
+    ('0387654321', 'ZALO', datetime(2026, 5, 3)),
+]
+SCHEDULES = [
+    ('0912345678', '', '7'),
+    ('+84912345678', '', '3,1'),
+    ('0912345678', 'Zalo', '14'),
+    ('+84912345678', 'Zalo', '5'),
+]
+LEDGER_ROWS = [
+    ('phone:0912345678', datetime(2026, 4, 1), 1),
+    ('phone:+84912345678', datetime(2026, 4, 1), 1),
+    ('account:+84912345678:Zalo', datetime(2026, 4, 5), 3),
+    ('account:0387654321:ZALO', datetime(2026, 5, 3), 1),
+]
+
+def build_database(path, version):
+    """Write the fixture data to a new database file laid out as schema `version`"""
+    def date(value):
+        return value.strftime("%Y-%m-%d") if version == 0 else value.toordinal()
+
+    tenant = () if version < 2 else (TENANT,)
+    placeholders = lambda count: ", ".join("?" * (count + len(tenant)))
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMAS[version] + (LEDGER if version >= 1 else ""))
+    for number, renewal_date in PHONES:
+        extra = (national_number(number), national_number(number)[::-1]) if version >= 3 else ()
+        conn.execute(
+            f"INSERT INTO phones VALUES ({placeholders(2 + len(extra))})",
+            tenant + (number, date(renewal_date)) + extra
+        )
+    for number, name, renewal_date in ACCOUNTS:
+        extra = (name.casefold(),) if version >= 3 else ()
+        conn.execute(
+            f"INSERT INTO accounts VALUES ({placeholders(3 + len(extra))})",
+            tenant + (number, name, date(renewal_date)) + extra
+        )
+    if version >= 1:
+        conn.executemany(
+            f"INSERT INTO reminder_schedules VALUES ({placeholders(3)})",
+            [tenant + row for row in SCHEDULES]
+        )
+        prefix = f"{TENANT}:" if version >= 2 else ""
+        conn.executemany(
+            "INSERT INTO reminder_ledger VALUES (?, ?, ?, '2026-01-01T00:00:00')",
+            [(prefix + key, renewal_date.toordinal(), offset) for key, renewal_date, offset in LEDGER_ROWS]
+        )
+    if version >= 3:
+        # What the version 3 triggers counted: one row per spelling
+        conn.execute(
+            "INSERT INTO account_names SELECT tenant_id, name_key, COUNT(*) FROM accounts GROUP BY 1, 2"
+        )
+    conn.execute(f"PRAGMA user_version = {version}")
+    conn.commit()
+    conn.close()
+
+class MigrationTest(unittest.TestCase):
+    """Open a database of each older schema version and check the migrated data"""
+
+    def open_migrated(self, version):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, f"v{version}.db")
+        build_database(path, version)
+        data_manager = DataManager(path, snapshot_path=None)
+        self.addCleanup(data_manager.close)
+        return data_manager
+
+    def check_migration(self, version):
+        data_manager = self.open_migrated(version)
+        conn = data_manager._connect()
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+
+        # Both spellings merged into one record with the latest dates
+        phones = data_manager.get_all_phones(tenant_id=TENANT)
+        self.assertEqual(sorted(phones), ['0387654321', '0912345678'])
+        merged = data_manager.get_phone('+84912345678', tenant_id=TENANT)
+        self.assertEqual(merged.phone_number, '0912345678')
+        self.assertEqual(merged.renewal_date, datetime(2026, 4, 1))
+        self.assertEqual(
+            [(account.name, account.renewal_date) for account in merged.accounts],
+            [
+                ('Zalo', datetime(2026, 4, 5)),
+                ('Gmail', datetime(2026, 3, 10)),
+                ('Facebook', datetime(2026, 4, 2)),
+            ]
+        )
+
+        # Vocabulary counts the merged accounts, not one per spelling
+        counts = dict(conn.execute(
+            "SELECT name_key, account_count FROM account_names WHERE tenant_id = ?", (TENANT,)
+        ).fetchall())
+        self.assertEqual(counts, {'zalo': 2, 'gmail': 1, 'facebook': 1})
+
+        if version == 0:
+            return
+
+        self.assertEqual(data_manager.get_reminder_offsets('0912345678', tenant_id=TENANT), (7, 3, 1))
+        self.assertEqual(data_manager.get_reminder_offsets('0912345678', 'Zalo', tenant_id=TENANT), (14, 5))
+
+        # Ledger keys carry the tenant and the display form of the number, so
+        # both spellings' deliveries collapse into one entry
+        ledger = conn.execute(
+            "SELECT item_key, renewal_date, reminder_offset FROM reminder_ledger ORDER BY 1"
+        ).fetchall()
+        self.assertEqual([tuple(row) for row in ledger], [
+            (f"{TENANT}:account:0387654321:ZALO", datetime(2026, 5, 3).toordinal(), 1),
+            (f"{TENANT}:account:0912345678:Zalo", datetime(2026, 4, 5).toordinal(), 3),
+            (f"{TENANT}:phone:0912345678", datetime(2026, 4, 1).toordinal(), 1),
+        ])
+
+    def test_from_v0(self):
+        self.check_migration(0)
+
+    def test_from_v1(self):
+        self.check_migration(1)
+
+    def test_from_v2(self):
+        self.check_migration(2)
+
+    def test_from_v3(self):
+        self.check_migration(3)
+
+    def test_invalid_number_aborts(self):
+        """A number with no canonical form stops the migration and leaves the file untouched"""
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "v2.db")
+        build_database(path, 2)
+        conn = sqlite3.connect(path)
+        conn.execute("INSERT INTO phones VALUES (?, '12345', 1)", (TENANT,))
+        conn.commit()
+        conn.close()
+        with self.assertRaises(ValueError):
+            DataManager(path, snapshot_path=None)
+        conn = sqlite3.connect(path)
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], 2)
+        conn.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+"""
+Number search tests: every spelling of a number prefix finds the same phones
+
+Usage: python -m pytest -q tests  (or python -m unittest discover tests)
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_manager import DataManager
+
+NUMBERS = ['0912345678', '0912000001', '0987654321', '0387654321']
+
+class NumberSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_manager = DataManager(os.path.join(tmp.name, 'search.db'), snapshot_path=None)
+        self.addCleanup(self.data_manager.close)
+        with self.data_manager.batch():
+            for number in NUMBERS:
+                self.data_manager.add_phone(number, datetime(2026, 6, 1))
+
+    def numbers(self, query):
+        return sorted(result['phone_number'] for result in self.data_manager.search(query))
+
+    def test_local_prefix(self):
+        self.assertEqual(self.numbers('0912'), ['0912000001', '0912345678'])
+
+    def test_country_code_prefix(self):
+        self.assertEqual(self.numbers('+849'), ['0912000001', '0912345678', '0987654321'])
+
+    def test_country_code_alone(self):
+        self.assertEqual(self.numbers('+84'), sorted(NUMBERS))
+
+    def test_other_country_code(self):
+        self.assertEqual(self.numbers('+5'), [])
+        self.assertEqual(self.numbers('+1234'), [])
+
+if __name__ == '__main__':
+    unittest.main()
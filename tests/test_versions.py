@@ -0,0 +1,49 @@
+"""
+Dataset version tests: every kind of write moves get_version(), which other
+processes and caches compare to notice changes
+
+Usage: python -m pytest -q tests  (or python -m unittest discover tests)
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_manager import DataManager
+
+class VersionTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_manager = DataManager(os.path.join(tmp.name, 'version.db'), snapshot_path=None)
+        self.addCleanup(self.data_manager.close)
+        self.data_manager.add_phone('0912345678', datetime(2026, 6, 1))
+        self.data_manager.add_account('0912345678', 'Zalo', datetime(2026, 6, 5))
+
+    def assertBumps(self, write):
+        version = self.data_manager.get_version()
+        write()
+        self.assertGreater(self.data_manager.get_version(), version)
+
+    def test_reminder_schedules_bump_version(self):
+        self.assertBumps(lambda: self.data_manager.set_reminder_offsets('0912345678', None, (7, 1)))
+        self.assertBumps(lambda: self.data_manager.set_reminder_offsets('0912345678', None, (3,)))
+        self.assertBumps(lambda: self.data_manager.set_reminder_offsets('0912345678', 'Zalo', (2,)))
+        self.assertBumps(lambda: self.data_manager.set_reminder_offsets('0912345678', None, ()))
+
+    def test_listeners_receive_commit_versions(self):
+        received = []
+        self.data_manager.add_listener(lambda *change: received.append(change[-1]))
+        before = self.data_manager.get_version()
+        with self.data_manager.batch():
+            self.data_manager.add_phone('0987654321', datetime(2026, 7, 1))
+            self.data_manager.add_account('0987654321', 'Gmail', datetime(2026, 7, 2))
+        after = self.data_manager.get_version()
+        self.assertEqual(received, [(before, after), (before, after)])
+
+if __name__ == '__main__':
+    unittest.main()
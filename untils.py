@@ -3,43 +3,81 @@ Utility functions for the Telegram bot
 """
 import datetime
 import re
+from functools import lru_cache
 
+# Patterns are compiled once at import time instead of on every call
+# Basic phone number validation (can be customized for specific country formats)
+# This validates common Vietnamese phone number formats
+PHONE_NUMBER_PATTERN = re.compile(r'(0|\+84)([35789][0-9]{8}|[16][0-9]{8}|[2][0-9]{9})')
+DATE_PATTERN = re.compile(r'([0-2][0-9]|3[0-1])/(0[1-9]|1[0-2])/([0-9]{4})')
+
+@lru_cache(maxsize=4096)
 def validate_phone_number(phone_number):
     """
     Validate if the provided string is a valid phone number format
     Returns True if valid, False otherwise
     """
-    # Basic phone number validation (can be customized for specific country formats)
-    # This validates common Vietnamese phone number formats
-    pattern = r'^(0|\+84)([35789][0-9]{8}|[16][0-9]{8}|[2][0-9]{9})$'
-    return bool(re.match(pattern, phone_number))
+    if not phone_number:
+        return False
+    return PHONE_NUMBER_PATTERN.fullmatch(phone_number) is not None
 
-def validate_date_format(date_str):
+def national_number(phone_number):
     """
-    Validate if the provided string is in DD/MM/YYYY format
-    Returns True if valid, False otherwise
+    Digits of a phone number without its 0 or +84 prefix
+    Both spellings accepted by validate_phone_number map to the same value
     """
-    pattern = r'^([0-2][0-9]|3[0-1])/(0[1-9]|1[0-2])/\d{4}$'
-    if not re.match(pattern, date_str):
-        return False
-    
-    # Further validate the date is actually valid
-    try:
-        day, month, year = map(int, date_str.split('/'))
-        datetime.datetime(year, month, day)
-        return True
-    except ValueError:
-        return False
+    if phone_number.startswith('+84'):
+        return phone_number[3:]
+    if phone_number.startswith('0'):
+        return phone_number[1:]
+    return phone_number
+
+# Country calling code and national number lengths of the numbers
+# validate_phone_number accepts
+COUNTRY_CODE = 84
+NATIONAL_NUMBER_LENGTHS = (9, 10)
+
+@lru_cache(maxsize=4096)
+def canonical_phone_key(phone_number):
+    """
+    Canonical storage key of a phone number: its E.164 form as an integer
+    '0912345678' and '+84912345678' both map to 84912345678, so every spelling
+    of a number finds the same record. Returns None if the number is not valid
+    """
+    if not validate_phone_number(phone_number):
+        return None
+    return int(f"{COUNTRY_CODE}{national_number(phone_number)}")
+
+def format_phone_key(phone_key):
+    """Display form of a canonical phone key (national format: 0912345678)"""
+    return '0' + str(phone_key)[len(str(COUNTRY_CODE)):]
 
+@lru_cache(maxsize=4096)
 def parse_date(date_str):
     """
     Parse a date string in DD/MM/YYYY format to a datetime object
+    Validates and converts in a single pass; raises ValueError if invalid
     """
-    if not validate_date_format(date_str):
+    match = DATE_PATTERN.fullmatch(date_str)
+    if match is None:
         raise ValueError("Invalid date format, use DD/MM/YYYY")
     
-    day, month, year = map(int, date_str.split('/'))
-    return datetime.datetime(year, month, day)
+    day, month, year = match.groups()
+    try:
+        return datetime.datetime(int(year), int(month), int(day))
+    except ValueError:
+        raise ValueError("Invalid date format, use DD/MM/YYYY") from None
+
+def validate_date_format(date_str):
+    """
+    Validate if the provided string is in DD/MM/YYYY format
+    Returns True if valid, False otherwise
+    """
+    try:
+        parse_date(date_str)
+        return True
+    except ValueError:
+        return False
 
 def format_date(date_obj):
     """
@@ -50,21 +88,170 @@ def format_date(date_obj):
 def is_renewal_soon(renewal_date, days_before=1):
     """
     Check if the renewal date is approaching within specified days
+    days_before can be a single number of days or a collection of them (e.g. (7, 3, 1))
     """
     today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    target_date = today + datetime.timedelta(days=days_before)
+    offsets = (days_before,) if isinstance(days_before, int) else days_before
     
     # Compare only the date part
-    renewal_date = renewal_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    return renewal_date.date() == target_date.date()
+    return renewal_date.date().toordinal() - today.date().toordinal() in offsets
 
-def format_reminder_message(item_type, identifier, renewal_date, account_name=None):
+def parse_offsets(text, max_days):
+    """
+    Parse a comma-separated list of reminder offsets in days (e.g. "7,3,1")
+    Returns the offsets as a tuple sorted from farthest to nearest; raises ValueError if invalid
+    """
+    try:
+        offsets = {int(part) for part in text.split(',') if part.strip()}
+    except ValueError:
+        raise ValueError("Offsets must be whole numbers of days") from None
+    if not offsets or min(offsets) < 0 or max(offsets) > max_days:
+        raise ValueError(f"Offsets must be between 0 and {max_days} days")
+    return tuple(sorted(offsets, reverse=True))
+
+def due_reminder_offsets(renewal_ordinal, offsets, followups, start_ordinal, end_ordinal):
+    """
+    Yield (offset, due_ordinal) for each reminder of a renewal due between start and end
+    A positive offset is sent that many days before the renewal; overdue
+    follow-ups are returned as negative offsets (days after the renewal)
+    """
+    for offset in offsets:
+        due = renewal_ordinal - offset
+        if start_ordinal <= due <= end_ordinal:
+            yield offset, due
+    for days in followups:
+        due = renewal_ordinal + days
+        if start_ordinal <= due <= end_ordinal:
+            yield -days, due
+
+def describe_offset(offset):
+    """
+    Human-readable (Vietnamese) timing of a reminder relative to its renewal date
+    """
+    if offset == 0:
+        return "Hôm nay"
+    if offset == 1:
+        return "Ngày mai"
+    if offset > 1:
+        return f"Còn {offset} ngày"
+    return f"Quá hạn {-offset} ngày"
+
+def format_reminder_message(item_type, identifier, renewal_date, account_name=None, offset=1):
     """
     Format a reminder message based on item type (phone or account)
+    A negative offset marks an overdue follow-up
     """
+    title = "QUÁ HẠN GIA HẠN" if offset < 0 else "NHẮC NHỞ GIA HẠN"
+    icon = "🚨" if offset < 0 else "⚠️"
     if item_type == "phone":
-        return f"⚠️ *NHẮC NHỞ GIA HẠN SỐ ĐIỆN THOẠI* ⚠️\n\nSố điện thoại: *{identifier}*\nNgày gia hạn: *{format_date(renewal_date)}*\n(Ngày mai)"
+        return f"{icon} *{title} SỐ ĐIỆN THOẠI* {icon}\n\nSố điện thoại: *{identifier}*\nNgày gia hạn: *{format_date(renewal_date)}*\n({describe_offset(offset)})"
     elif item_type == "account":
-        return f"⚠️ *NHẮC NHỞ GIA HẠN TÀI KHOẢN* ⚠️\n\nSố điện thoại: *{identifier}*\nTài khoản: *{account_name}*\nNgày gia hạn: *{format_date(renewal_date)}*\n(Ngày mai)"
+        return f"{icon} *{title} TÀI KHOẢN* {icon}\n\nSố điện thoại: *{identifier}*\nTài khoản: *{account_name}*\nNgày gia hạn: *{format_date(renewal_date)}*\n({describe_offset(offset)})"
     return None
+
+
+def escape_markdown(text):
+    """
+    Escape the characters that have a meaning in Telegram's Markdown parse mode
+    """
+    return re.sub(r'([_*`\[])', r'\\\1', text)
+
+def message_length(text):
+    """
+    Length of a message as Telegram counts it (UTF-16 code units)
+    """
+    return len(text.encode('utf-16-le')) // 2
+
+def chunk_blocks(blocks, max_length, separator="\n\n"):
+    """
+    Pack text blocks into as few chunks as possible, each at most max_length long
+    Blocks are never split unless a single block is itself too long, in which
+    case it is cut at line boundaries (or hard-cut as a last resort)
+    """
+    for chunk, _ in pack_blocks(((block, None) for block in blocks), max_length, separator):
+        yield chunk
+
+def pack_blocks(blocks, max_length, separator="\n\n"):
+    """
+    Like chunk_blocks, for (block, payload) pairs
+    Yields (chunk, payloads) so callers know which blocks each chunk carries;
+    when an oversized block is split, its payload goes with its last piece
+    """
+    chunk = []
+    payloads = []
+    size = 0
+    for block, payload in blocks:
+        block_length = message_length(block)
+        if block_length > max_length:
+            if chunk:
+                yield separator.join(chunk), payloads
+                chunk = []
+                payloads = []
+                size = 0
+            lines = block.split("\n")
+            pieces = []
+            for line in lines:
+                while message_length(line) > max_length:
+                    # Half the limit keeps a hard cut safe even for surrogate pairs
+                    pieces.append(line[:max_length // 2])
+                    line = line[max_length // 2:]
+                pieces.append(line)
+            split = list(chunk_blocks(pieces, max_length, separator="\n"))
+            for piece in split[:-1]:
+                yield piece, []
+            yield split[-1], [payload]
+            continue
+        
+        extra = block_length + (len(separator) if chunk else 0)
+        if chunk and size + extra > max_length:
+            yield separator.join(chunk), payloads
+            chunk = []
+            payloads = []
+            size = 0
+            extra = block_length
+        chunk.append(block)
+        payloads.append(payload)
+        size += extra
+    
+    if chunk:
+        yield separator.join(chunk), payloads
+
+def format_digest_messages(renewals, max_length=4096, with_items=False):
+    """
+    Group renewals by phone number and pack them into as few messages as possible
+    Returns a list of Markdown messages, each within Telegram's length limit;
+    with_items=True returns (message, renewals_in_message) pairs instead
+    """
+    by_phone = {}
+    for renewal in renewals:
+        by_phone.setdefault(renewal['phone_number'], []).append(renewal)
+    
+    blocks = []
+    for phone_number, items in by_phone.items():
+        lines = [f"📱 *{escape_markdown(phone_number)}*"]
+        for item in items:
+            renewal_date = format_date(item['renewal_date'])
+            if 'offset' in item:
+                renewal_date += f" ({describe_offset(item['offset'])})"
+            if item['type'] == 'phone':
+                lines.append(f"  • Số điện thoại - {renewal_date}")
+            else:
+                lines.append(f"  • Tài khoản {escape_markdown(item['account_name'])} - {renewal_date}")
+        blocks.append(("\n".join(lines), items))
+    
+    if not blocks:
+        return []
+    
+    # Leave room for the header, which carries a "(page/total)" counter
+    header = "⚠️ *NHẮC NHỞ GIA HẠN* ⚠️ ({page}/{total})\n{count} mục cần gia hạn\n\n"
+    reserved = message_length(header.format(page=99999, total=99999, count=len(renewals)))
+    chunks = list(pack_blocks(blocks, max_length - reserved))
+    
+    messages = []
+    for page, (chunk, groups) in enumerate(chunks, 1):
+        message = header.format(page=page, total=len(chunks), count=len(renewals)) + chunk
+        if with_items:
+            messages.append((message, [item for group in groups for item in group]))
+        else:
+            messages.append(message)
+    return messages
\ No newline at end of file